@@ -15,11 +15,17 @@ where:
 name: name of the city
 recno: record number starting from 0
 
+The server also has f'{TOP_API_URL}/records/{name}/{start}/{count}', a list
+of count records from record number start, with one delay for the whole list.
+The request threads use it with ?stream=1 to get RECORDS_PER_REQUEST records
+per call.  The reply is sent in chunks, one record per line, and each record
+goes on the response queue as soon as it arrives.
+
 """
 import time
 import queue
 import threading
-import requests
+import numpy as np
 
 from common import *
 
@@ -28,23 +34,16 @@ from cse351 import *
 REQUEST_THREAD_COUNT = 200
 WORKER_THREAD_COUNT = 10
 RECORDS_TO_RETRIEVE = 5000  # Don't change
+RECORDS_PER_REQUEST = 500
+STREAM_ATTEMPTS = 5         # tries to get the whole range when a stream breaks
+WORKER_CHUNK_SIZE = 256     # most records a worker takes off the queue at once
 
 
 # ---------------------------------------------------------------------------
 def retrieve_weather_data(request_queue, response_queue):
     """Fetch records from the server and place them on the response queue."""
-    
-    # Use a Session to reuse connections - found this in requests docs
-    # Program was too slow without it (over 60 seconds)
-    # Increase connection pool size to handle more concurrent requests
-    session = requests.Session()
-    adapter = requests.adapters.HTTPAdapter(
-        pool_connections=100,
-        pool_maxsize=100,
-        max_retries=0
-    )
-    session.mount('http://', adapter)
-    
+    # get_data_from_server() shares one pooled client between all threads
+
     while True:
         command = request_queue.get()
         # Check for stop signal (None means we're done)
@@ -52,30 +51,23 @@ def retrieve_weather_data(request_queue, response_queue):
             request_queue.task_done()
             break
 
-        city, record_no = command
+        city, start, count = command
         
-        # Get the weather data from server
-        url = f'{TOP_API_URL}/record/{city}/{record_no}'
-        try:
-            response = session.get(url, timeout=10)
-            if response.status_code == 200:
-                payload = response.json()
-            else:
-                payload = None
-        except:
-            # If session fails, use the fallback function from common.py
-            payload = get_data_from_server(url)
-        
-        # Put the data on response queue for workers to process
-        if payload is not None:
-            response_queue.put((payload['city'], payload['date'], payload['temp']))
+        # Stream a batch of weather records from server, each record goes on
+        # the response queue for workers to process as soon as it arrives.
+        # A stream that breaks is asked again from the first missing record.
+        received = 0
+        for _ in range(STREAM_ATTEMPTS):
+            url = f'{TOP_API_URL}/records/{city}/{start + received}/{count - received}?stream=1'
+            for record in get_json_lines_from_server(url):
+                response_queue.put((record['city'], record['date'], record['temp']))
+                received += 1
+            if received == count:
+                break
         # else:
-        #     print(f'Failed to get data for {city} record {record_no}')
+        #     print(f'Failed to get data for {city} records {start + received} to {start + count - 1}')
 
         request_queue.task_done()
-    
-    # Clean up
-    session.close()
 
 
 # ---------------------------------------------------------------------------
@@ -87,55 +79,97 @@ class Worker(threading.Thread):
         self.noaa = noaa
 
     def run(self):
-        while True:
-            record = self.queue.get()
-            if record is None:
+        done = False
+        while not done:
+            # Wait for one record, then take whatever else is already queued
+            # (up to WORKER_CHUNK_SIZE) so each city lock is taken once per chunk
+            chunk = [self.queue.get()]
+            while chunk[-1] is not None and len(chunk) < WORKER_CHUNK_SIZE:
+                try:
+                    chunk.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # Stop at our own None, the other workers need theirs
+            if chunk[-1] is None:
+                chunk.pop()
+                done = True
+
+            # Process the records, grouped by city
+            by_city = {}
+            for city, date, temp in chunk:
+                dates, temps = by_city.setdefault(city, ([], []))
+                dates.append(date)
+                temps.append(temp)
+            for city, (dates, temps) in by_city.items():
+                # print(f'{self.name}: Processing {city} - {len(temps)} records')  # Used this for debugging
+                self.noaa.add_records(city, dates, temps)
+
+            # Let queue know we're done with these items
+            for _ in range(len(chunk) + done):
                 self.queue.task_done()  # Important! Forgot this at first and program hung
-                break
-            
-            # Process the record
-            city, date, temp = record
-            # print(f'{self.name}: Processing {city} - {date}')  # Used this for debugging
-            self.noaa.add_record(city, date, temp)
-            self.queue.task_done()  # Let queue know we're done with this item
 
 
 # ---------------------------------------------------------------------------
 class NOAA:
-    """Accumulator for per-city temperature data."""
+    """Accumulator for per-city temperature data.
+
+    Each city has NumPy arrays for its dates and temps, preallocated for
+    RECORDS_TO_RETRIEVE records (they double if more arrive), and the
+    number of records filled in.  Statistics are computed over the filled
+    part of the arrays in one call each.
+    """
+
+    PERCENTILES = (10, 50, 90, 99)
+
+    def __init__(self, capacity=RECORDS_TO_RETRIEVE):
+        self.capacity = capacity
 
-    def __init__(self):
         # Dictionary to store all city data along with a lock for each city
         self.city_data = {}
         for city in CITIES:
-            self.city_data[city] = {
-                'records': [],
-                'total_temp': 0.0,
-                'lock': threading.Lock(),
-            }
+            self.city_data[city] = self._new_city()
 
         # Separate lock to guard the dictionary if a new city shows up unexpectedly
         self._city_dict_lock = threading.Lock()
 
+    def _new_city(self):
+        return {
+            'dates': np.empty(self.capacity, dtype='U14'),   # "mm-dd hh:mm:ss"
+            'temps': np.empty(self.capacity, dtype=np.float64),
+            'count': 0,
+            'lock': threading.Lock(),
+        }
+
     def add_record(self, city, date, temp):
         """Add a single (date, temp) pair to the specified city."""
+        self.add_records(city, [date], [temp])
+
+    def add_records(self, city, dates, temps):
+        """Add a list of dates and the matching list of temps to the specified city."""
         city_info = self.city_data.get(city)
         if city_info is None:
             # This should not happen often, but handle it anyway
             with self._city_dict_lock:
                 city_info = self.city_data.get(city)
                 if city_info is None:
-                    city_info = {
-                        'records': [],
-                        'total_temp': 0.0,
-                        'lock': threading.Lock(),
-                    }
+                    city_info = self._new_city()
                     self.city_data[city] = city_info
 
         # Use the per-city lock so different cities can update in parallel
         with city_info['lock']:
-            city_info['records'].append((date, temp))
-            city_info['total_temp'] += temp
+            start = city_info['count']
+            end = start + len(temps)
+            if end > len(city_info['temps']):
+                size = max(end, 2 * len(city_info['temps']))
+                for name in ('dates', 'temps'):
+                    grown = np.empty(size, dtype=city_info[name].dtype)
+                    grown[:start] = city_info[name][:start]
+                    city_info[name] = grown
+
+            city_info['dates'][start:end] = dates
+            city_info['temps'][start:end] = temps
+            city_info['count'] = end
 
     def get_temp_details(self, city):
         city_info = self.city_data.get(city)
@@ -143,13 +177,46 @@ class NOAA:
             return 0.0
 
         with city_info['lock']:
-            num_records = len(city_info['records'])
+            num_records = city_info['count']
             if num_records == 0:
                 return 0.0
 
             # Calculate average
-            avg_temp = city_info['total_temp'] / num_records
-            return avg_temp
+            return float(city_info['temps'][:num_records].mean())
+
+    def get_temp_stats(self, city):
+        """Count, mean, min, max, standard deviation and PERCENTILES of a city's temps."""
+        city_info = self.city_data.get(city)
+        if city_info is None:
+            return None
+
+        with city_info['lock']:
+            temps = city_info['temps'][:city_info['count']]
+            if len(temps) == 0:
+                return None
+
+            stats = {
+                'count': len(temps),
+                'mean': float(temps.mean()),
+                'min': float(temps.min()),
+                'max': float(temps.max()),
+                'std': float(temps.std()),
+            }
+            for percent, value in zip(self.PERCENTILES, np.percentile(temps, self.PERCENTILES)):
+                stats[f'p{percent}'] = float(value)
+            return stats
+
+
+# ---------------------------------------------------------------------------
+def print_noaa_stats(noaa):
+    print()
+    print('NOAA Results: Temperature Statistics')
+    columns = ['count', 'mean', 'min', 'max', 'std'] + [f'p{percent}' for percent in NOAA.PERCENTILES]
+    print(f'{"City":>15}: ' + ' '.join(f'{column:>8}' for column in columns))
+    for name in CITIES:
+        stats = noaa.get_temp_stats(name)
+        if stats is not None:
+            print(f'{name:>15}: {stats["count"]:>8} ' + ' '.join(f'{stats[column]:>8.3f}' for column in columns[1:]))
 
 
 # ---------------------------------------------------------------------------
@@ -234,11 +301,11 @@ def main():
         thread.start()
         request_threads.append(thread)
 
-    # Put all the work items in the queue
+    # Put all the work items in the queue, one per batch of records
     for city in CITIES:
         total_records = min(records, city_details[city]['records'])
-        for record_no in range(total_records):
-            request_queue.put((city, record_no))
+        for start in range(0, total_records, RECORDS_PER_REQUEST):
+            request_queue.put((city, start, min(RECORDS_PER_REQUEST, total_records - start)))
 
     # Send stop signal to threads (None means stop)
     # Need to send one None for each thread so they all stop
@@ -265,6 +332,7 @@ def main():
     for worker in workers:
         worker.join()
 
+    print_noaa_stats(noaa)
 
 
 
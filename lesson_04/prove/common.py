@@ -14,7 +14,10 @@ Common data for the assignment
 import time
 import threading
 import json
+import random
+import logging
 import requests
+import requests.adapters
 
 from cse351 import *
 
@@ -34,27 +37,139 @@ CITIES = (
 )
 
 # ----------------------------------------------------------------------------
-def get_data_from_server(url):
-    retries = 50
-    delay = 0.01 # seconds
-    for i in range(retries):
-        try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            if response.status_code == 200 and response.json() is not None:
-                return response.json()
-            break
-
-        except requests.exceptions.ConnectionError as e:
-            if i < retries - 1:
-                time.sleep(delay)
+class PooledClient:
+    """
+    HTTP client shared by every thread.
+
+    - one requests.Session, its adapter keeps up to pool_size open connections
+      so threads reuse them instead of opening a new one for every call
+    - connection errors and timeouts are retried with exponential backoff and
+      jitter, a 429/503 reply waits for the server's Retry-After
+    - budget is the most time one call may take including all of its retries
+    - after breaker_threshold failed attempts in a row the circuit opens and
+      calls return None right away for breaker_cooldown seconds
+    """
+
+    def __init__(self, pool_size=100, retries=50, backoff=0.01, max_backoff=0.5,
+                 timeout=10, budget=30, breaker_threshold=100, breaker_cooldown=5):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.budget = budget
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.open_until = 0
+
+    def get(self, url):
+        response = self.open(url)
+        return None if response is None else response.json()
+
+    def get_json_lines(self, url):
+        """
+        Objects of an NDJSON reply, each one as soon as its line arrives.
+        A stream that breaks just ends early, the caller can tell from the
+        number of objects and ask again for the rest.
+        """
+        response = self.open(url, stream=True)
+        if response is None:
+            return
+        with response:
+            try:
+                # the read size is an upper bound, each chunk is handed over as it arrives
+                for line in response.iter_lines(chunk_size=65536):
+                    if line:
+                        yield json.loads(line)
+            except requests.exceptions.RequestException:
+                self._failed()
+
+    def open(self, url, stream=False):
+        """ The 200 response to a GET, with retries, None if there isn't one """
+        deadline = time.perf_counter() + self.budget
+        for attempt in range(self.retries):
+            if self._circuit_open():
+                return None
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+
+            try:
+                response = self.session.get(url, timeout=min(self.timeout, remaining), stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self._failed()
+                delay = self._backoff_delay(attempt)
+            except requests.exceptions.RequestException:
+                return None
             else:
-                print("Max retries reached. Failing.")
-                
-        except requests.exceptions.Timeout:
-            ...
-            
-        except requests.exceptions.RequestException as e:
-            break
-
-    return None
\ No newline at end of file
+                self._succeeded()
+                if response.status_code == 200:
+                    return response
+                # a streamed body hasn't been read, give the connection back
+                response.close()
+                if response.status_code in (429, 503):
+                    # the server is up but busy, wait as long as it asks
+                    delay = self._retry_after(response, attempt)
+                else:
+                    return None
+
+            time.sleep(max(0, min(delay, deadline - time.perf_counter())))
+
+        print("Max retries reached. Failing.")
+        return None
+
+    def _backoff_delay(self, attempt):
+        # "full jitter": a random delay up to the exponential backoff, so
+        # threads that failed together don't all retry together
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _retry_after(self, response, attempt):
+        try:
+            return float(response.headers['Retry-After'])
+        except (KeyError, ValueError):
+            return self._backoff_delay(attempt)
+
+    def _circuit_open(self):
+        with self.lock:
+            return time.perf_counter() < self.open_until
+
+    def _failed(self):
+        with self.lock:
+            self.failures += 1
+            # stays open after the cool down until an attempt succeeds
+            if self.failures >= self.breaker_threshold:
+                self.open_until = time.perf_counter() + self.breaker_cooldown
+
+    def _succeeded(self):
+        with self.lock:
+            self.failures = 0
+            self.open_until = 0
+
+    def close(self):
+        self.session.close()
+
+
+# A full pool only means the extra connection is closed after its call
+logging.getLogger('urllib3.connectionpool').setLevel(logging.ERROR)
+
+client = PooledClient(pool_size=200)
+
+def configure_client(**options):
+    """ Replace the shared client, ie: configure_client(pool_size=200) """
+    global client
+    client.close()
+    client = PooledClient(**options)
+
+# ----------------------------------------------------------------------------
+def get_data_from_server(url):
+    return client.get(url)
+
+def get_json_lines_from_server(url):
+    return client.get_json_lines(url)
\ No newline at end of file
@@ -9,6 +9,10 @@ Instructions:
 
 Open a terminal window and run this program
 
+    python server.py
+    python server.py --quiet --async-log    (high throughput, no per-request output)
+    python server.py --data-cache           (keep the parsed city data in data/*.dat.cache)
+
 *******************  DO NOT MODIFY!!!!  *********************
 *******************  DO NOT MODIFY!!!!  *********************
 *******************  DO NOT MODIFY!!!!  *********************
@@ -27,6 +31,10 @@ API
 /end
 /city/{city}
 /record/{city}/{recno}`
+/records/{city}/{start}/{count}   (up to MAX_RECORDS_PER_CALL records as a JSON array,
+                                   ?format=ndjson for one JSON object per line,
+                                   ?stream=1 for NDJSON sent as it is made, chunked)
+/stats              (per-endpoint counts and latency histograms, not counted as a call)
 
 """
 
@@ -37,22 +45,32 @@ import json
 import time
 import random
 import threading
+import queue
+import argparse
 import ast
+import math
+import os
+from array import array
+from urllib.parse import urlsplit, parse_qs
 
 # Consts
 hostName = "127.0.0.1"
 serverPort = 8123
 
 SLEEP = 0.1
+MAX_RECORDS_PER_CALL = 1000
+STREAM_CHUNK_RECORDS = 50     # records in each chunk of a ?stream=1 reply
 MAX_GENERATIONS = 6
 
 DATA_FOLDER = 'data/'
 
 # Global Variables
-max_thread_count = 0
-call_count = 0
-thread_count = 0
-lock = threading.Lock()
+
+# --quiet: no per-request console or log output
+quiet = False
+
+# --data-cache: read and write the parsed city data in .cache files
+data_cache = False
 
 CITIES = (
     # City name, city filename
@@ -68,7 +86,7 @@ CITIES = (
     ('phoenix' , 'phoenix.dat'),
 )
 
-# key = 'city name', value [[date, temp], ...]
+# key = 'city name', value CityData
 cities_data = {}
 
 start_time = time.time()
@@ -82,22 +100,438 @@ class Log:
         self.lock = threading.Lock()
         self.filename = filename
         self.file = open(filename, 'w')
+        self.queue = None
+
+    def start_writer(self, batch_size=1000):
+        """
+        Hand lines to a background thread instead of writing them in the
+        request thread.  The writer flushes once per batch, not once per line.
+        """
+        self.batch_size = batch_size
+        self.queue = queue.SimpleQueue()
+        threading.Thread(target=self._writer, name='log-writer', daemon=True).start()
+
+    def _writer(self):
+        while True:
+            items = [self.queue.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = [item for item in items if isinstance(item, str)]
+            with self.lock:
+                if lines:
+                    self.file.write('\n'.join(lines))
+                    self.file.write('\n')
+                self.file.flush()
+
+            # flush() requests
+            for item in items:
+                if isinstance(item, threading.Event):
+                    item.set()
 
     def write(self, line):
+        if self.queue != None:
+            self.queue.put(line)
+            return
+
         with self.lock:
             self.file.write(line)
             self.file.write('\n')
             self.file.flush()
 
+    def flush(self):
+        """ Wait until the background writer has written everything queued so far """
+        if self.queue != None:
+            done = threading.Event()
+            self.queue.put(done)
+            done.wait()
+
     def __del__(self):
         self.file.close()
 
 # Global log object
 log = Log('server.log')
 
+
+# ----------------------------------------------------------------------------
+class RequestCounters:
+    """
+    Request accounting without a shared lock.  Each thread only updates its
+    own cell [calls, max active, records served] and the cells are merged
+    when the totals are needed (/end).  In-flight requests are tracked with list append() /
+    pop(), which are atomic in CPython.
+    """
+
+    def __init__(self):
+        self.cells = {}
+        self.active = []
+
+    def _cell(self):
+        cell = self.cells.get(threading.get_ident())
+        if cell == None:
+            cell = self.cells.setdefault(threading.get_ident(), [0, 0, 0])
+        return cell
+
+    def enter(self):
+        self.active.append(None)
+        active = len(self.active)
+        cell = self._cell()
+        cell[0] += 1
+        if active > cell[1]:
+            cell[1] = active
+        return active
+
+    def leave(self):
+        self.active.pop()
+
+    def add_records(self, count):
+        self._cell()[2] += count
+
+    def reset(self):
+        # /start counts as the first call of the new run
+        self.cells = {threading.get_ident(): [1, 1, 0]}
+
+    def totals(self):
+        """ Returns (calls, max active) """
+        cells = list(self.cells.values())
+        calls = sum(cell[0] for cell in cells)
+        max_active = max((cell[1] for cell in cells), default=0)
+        return calls, max_active
+
+    def records(self):
+        """ Weather records sent by /record and /records """
+        return sum(cell[2] for cell in list(self.cells.values()))
+
+# Global request counters
+counters = RequestCounters()
+
+
+# ----------------------------------------------------------------------------
+class LatencyHistogram:
+    """
+    HDR style histogram of durations, recorded in microseconds.  Each power
+    of two range is split into 16 linear sub-buckets, so a reported value is
+    within about 6% of the recorded one whatever its size.
+    """
+
+    SUB_BUCKETS = 16
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @classmethod
+    def index(cls, value):
+        if value < 2 * cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - 5
+        return (shift + 1) * cls.SUB_BUCKETS + (value >> shift) - cls.SUB_BUCKETS
+
+    @classmethod
+    def highest_value(cls, index):
+        if index < 2 * cls.SUB_BUCKETS:
+            return index
+        shift = index // cls.SUB_BUCKETS - 1
+        return ((index % cls.SUB_BUCKETS + cls.SUB_BUCKETS + 1) << shift) - 1
+
+    def record(self, seconds):
+        value = max(0, int(seconds * 1_000_000))
+        index = self.index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """ Add the values recorded by other """
+        for index, count in list(other.counts.items()):
+            self.counts[index] = self.counts.get(index, 0) + count
+            self.count += count
+        self.total += other.total
+        if other.max > self.max:
+            self.max = other.max
+
+    def percentile(self, percent):
+        if self.count == 0:
+            return 0
+        wanted = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= wanted:
+                return min(self.highest_value(index), self.max)
+        return self.max
+
+    def summary(self):
+        """ Milliseconds """
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count / 1000, 3) if self.count else 0,
+            'p50': self.percentile(50) / 1000,
+            'p90': self.percentile(90) / 1000,
+            'p99': self.percentile(99) / 1000,
+            'p999': self.percentile(99.9) / 1000,
+            'max': self.max / 1000,
+        }
+
+
+class MetricsRegistry:
+    """
+    Per-endpoint request counts, status codes and latency histograms split
+    into queueing time (accepted -> handler starts) and service time
+    (handler starts -> reply written), plus the highest number of requests in
+    flight for each second of the run.  snapshot() doesn't reset anything, so
+    /stats can be polled while a client is running.
+
+    Like RequestCounters there is no shared lock: each thread records into
+    its own cell (endpoints, concurrency) and snapshot() merges the cells.
+    """
+
+    MAX_SECONDS = 3600
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.monotonic()
+        self.cells = {}
+
+    def _cell(self):
+        cell = self.cells.get(threading.get_ident())
+        if cell == None:
+            cell = self.cells.setdefault(threading.get_ident(), ({}, {}))
+        return cell
+
+    @staticmethod
+    def _new_stats():
+        return {'count': 0, 'status': {}, 'queue': LatencyHistogram(), 'service': LatencyHistogram()}
+
+    def record(self, endpoint, status, queued, service):
+        endpoints = self._cell()[0]
+        stats = endpoints.get(endpoint)
+        if stats == None:
+            stats = endpoints[endpoint] = self._new_stats()
+        stats['count'] += 1
+        stats['status'][status] = stats['status'].get(status, 0) + 1
+        stats['queue'].record(queued)
+        stats['service'].record(service)
+
+    def sample_concurrency(self, in_flight):
+        second = int(time.monotonic() - self.started)
+        concurrency = self._cell()[1]
+        if in_flight > concurrency.get(second, 0):
+            concurrency[second] = in_flight
+            if len(concurrency) > self.MAX_SECONDS:
+                del concurrency[min(concurrency)]
+
+    def snapshot(self):
+        # list() copies are taken in one step, the threads keep recording
+        endpoints = {}
+        concurrency = {}
+        for cell_endpoints, cell_concurrency in list(self.cells.values()):
+            for name, stats in list(cell_endpoints.items()):
+                merged = endpoints.get(name)
+                if merged == None:
+                    merged = endpoints[name] = self._new_stats()
+                merged['count'] += stats['count']
+                for code, count in list(stats['status'].items()):
+                    merged['status'][code] = merged['status'].get(code, 0) + count
+                merged['queue'].merge(stats['queue'])
+                merged['service'].merge(stats['service'])
+            for second, in_flight in list(cell_concurrency.items()):
+                if in_flight > concurrency.get(second, 0):
+                    concurrency[second] = in_flight
+
+        return {
+            'uptime': round(time.monotonic() - self.started, 3),
+            'endpoints': {
+                name: {
+                    'count': stats['count'],
+                    'status': {str(code): count for code, count in stats['status'].items()},
+                    'queue_ms': stats['queue'].summary(),
+                    'service_ms': stats['service'].summary(),
+                } for name, stats in endpoints.items()
+            },
+            'concurrency': sorted(concurrency.items())[-self.MAX_SECONDS:],
+        }
+
+# Global metrics, reset by /start and read by /stats
+metrics = MetricsRegistry()
+
+
+def endpoint_of(path):
+    """ Endpoint name for a request path, used for statistics """
+    path = urlsplit(path).path
+    if path == '/stats':
+        return 'stats'
+    # 'records' before 'record', it contains it
+    for name in ('start', 'end', 'city', 'records', 'record'):
+        if name in path:
+            return name
+    return 'other'
+
+
+def stats_json():
+    call_count, max_thread_count = counters.totals()
+    record_count = counters.records()
+    elapsed = max(time.time() - start_time, 1e-9)
+    data = metrics.snapshot()
+    data.update({
+        "in_flight": len(counters.active),
+        "api": call_count,
+        "threads": max_thread_count,
+        "calls_per_second": call_count / elapsed,
+        "records": record_count,
+        "records_per_second": record_count / elapsed,
+    })
+    return json.dumps(data)
+
+
+def expand_date(date_str):
+    # Expand date string to "mm-dd hh:mm:ss"
+    #         01234567890
+    # format "mmdd hhmmss"
+    return date_str[:2] + '-' + date_str[2:4] + ' ' + date_str[5:7] + ':' + date_str[7:9] + ':' + date_str[9:]
+
+
+# ----------------------------------------------------------------------------
+class CityData:
+    """
+    The records of one city, parsed once.  Temperatures are an array of ints
+    and the dates, already expanded to "mm-dd hh:mm:ss", are one bytes buffer
+    of DATE_WIDTH characters per record.  A request only slices them instead
+    of reformatting every date it sends.
+    """
+
+    DATE_WIDTH = 14
+    CACHE_MAGIC = b'CSE351W1'
+
+    def __init__(self, temps, dates):
+        self.temps = temps
+        self.dates = dates
+
+    @classmethod
+    def from_dat(cls, filename):
+        with open(filename, 'r') as f:
+            records = json.load(f)
+
+        temps = array('i', (temp for _, temp in records))
+        dates = ''.join(expand_date(date_str) for date_str, _ in records).encode('ascii')
+        if len(dates) != cls.DATE_WIDTH * len(temps):
+            raise ValueError(f'{filename}: dates are not all "mmdd hhmmss"')
+        return cls(temps, dates)
+
+    @classmethod
+    def from_cache(cls, filename):
+        with open(filename, 'rb') as f:
+            if f.read(len(cls.CACHE_MAGIC)) != cls.CACHE_MAGIC:
+                raise ValueError(f'{filename}: not a city data cache')
+            count = array('q')
+            count.fromfile(f, 1)
+            temps = array('i')
+            temps.fromfile(f, count[0])
+            dates = f.read(cls.DATE_WIDTH * count[0])
+
+        if len(dates) != cls.DATE_WIDTH * count[0]:
+            raise ValueError(f'{filename}: cache is cut short')
+        return cls(temps, dates)
+
+    def save(self, filename):
+        # written under another name first, a crash never leaves half a cache
+        with open(filename + '.tmp', 'wb') as f:
+            f.write(self.CACHE_MAGIC)
+            array('q', [len(self)]).tofile(f)
+            self.temps.tofile(f)
+            f.write(self.dates)
+        os.replace(filename + '.tmp', filename)
+
+    def __len__(self):
+        return len(self.temps)
+
+    def record(self, index):
+        """ (date, temp) of one record, index works like a list index """
+        temp = self.temps[index]
+        if index < 0:
+            index += len(self.temps)
+        return self.dates[index * self.DATE_WIDTH:(index + 1) * self.DATE_WIDTH].decode('ascii'), temp
+
+    def records(self, start, count):
+        """ [(date, temp), ...] of up to count records from start """
+        temps = self.temps[start:start + count]
+        width = self.DATE_WIDTH
+        text = self.dates[start * width:(start + len(temps)) * width].decode('ascii')
+        return list(zip((text[i:i + width] for i in range(0, len(text), width)), temps))
+
+
+def load_city(filename):
+    """ Parse a city's .dat file, or with --data-cache read its cache if it is newer """
+    path = DATA_FOLDER + filename
+    cache_path = path + '.cache'
+    if data_cache:
+        try:
+            if os.path.getmtime(cache_path) >= os.path.getmtime(path):
+                return CityData.from_cache(cache_path)
+        except (OSError, ValueError, EOFError):
+            pass    # no cache or a bad one, it is made again
+
+    city = CityData.from_dat(path)
+    if data_cache:
+        city.save(cache_path)
+    return city
+
 # ----------------------------------------------------------------------------
 class Handler(BaseHTTPRequestHandler):
 
+    def log_message(self, format, *args):
+        # the per-request access line on stderr
+        if not quiet:
+            super().log_message(format, *args)
+
+    def setup(self):
+        super().setup()
+        self.accepted_at = accepted_times.pop(self.request.fileno(), None)
+
+    def send_response(self, code, message=None):
+        self.reply_status = code
+        super().send_response(code, message)
+
+    def send_records_stream(self, name, start, count):
+        """
+        Send count records of a city from start as NDJSON with chunked
+        transfer encoding, one chunk of STREAM_CHUNK_RECORDS lines at a time.
+        Only one chunk is built at a time and the client can use the first
+        records while the rest are sent.
+        """
+        # chunked needs an HTTP/1.1 reply, the connection is still closed after it
+        self.protocol_version = 'HTTP/1.1'
+        self.send_response(200)
+        self.send_header("Content-type",  "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        city = cities_data[name]
+        end = min(start + count, len(city))
+        try:
+            for i in range(start, end, STREAM_CHUNK_RECORDS):
+                chunk = city.records(i, min(STREAM_CHUNK_RECORDS, end - i))
+                lines = ''.join(json.dumps({"city": name, "date": date_str, "temp": temp}) + '\n'
+                                for date_str, temp in chunk)
+                data = bytes(lines, "utf8")
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                counters.add_records(len(chunk))
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # the client went away, it asks again for what it didn't get
+            pass
+
     def get_city_details(self, name):
         # global people
         # if id in people:
@@ -115,42 +549,60 @@ class Handler(BaseHTTPRequestHandler):
         #     return None
         pass
 
-   
+
     def do_GET(self):
-        global thread_count
-        global lock
-        global max_thread_count
-        global call_count
+        started = time.perf_counter()
+        endpoint = endpoint_of(self.path)
+        if endpoint == 'stats':
+            body = bytes(stats_json(), 'utf8')
+            self.send_response(200)
+            self.send_header("Content-type",  "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        # queueing is only measured for the first request on a connection
+        queued = 0.0 if self.accepted_at == None else started - self.accepted_at
+        self.accepted_at = None
+
+        self.reply_status = None
+        try:
+            self.handle_get()
+        finally:
+            metrics.record(endpoint, self.reply_status, queued, time.perf_counter() - started)
+
+    def handle_get(self):
         global log
 
-        with lock:
-            thread_count += 1
-            call_count += 1
-            if thread_count > max_thread_count:
-                max_thread_count = thread_count
+        thread_count = counters.enter()
+        metrics.sample_concurrency(thread_count)
+
+        if not quiet:
+            _, max_thread_count = counters.totals()
             print(f'Current: active threads / max count: {thread_count} / {max_thread_count}')
             log.write(f'Current: active threads / max count: {thread_count} / {max_thread_count}')
 
-        print('- ' * 35)
-        print(s := f'Request: {self.path}')
-        log.write(s)
+            print('- ' * 35)
+            print(s := f'Request: {self.path}')
+            log.write(s)
+
+        content_type = "application/json"
 
         # START ---------------------------------------------------
         if 'start' in self.path:
             global start_time
             global cities_data
 
-            # Load DAT files
-            cities_data = {}
+            # Load DAT files, only the first time, the data doesn't change between runs
             for name, filename in CITIES:
-                print(s := f'Loading city data {name}')
-                log.write(s)
-                with open(DATA_FOLDER + filename, 'r') as f:
-                    cities_data[name] = json.load(f)
+                if name not in cities_data:
+                    print(s := f'Loading city data {name}')
+                    log.write(s)
+                    cities_data[name] = load_city(filename)
 
-            max_thread_count = 1
-            thread_count = 1
-            call_count = 1
+            counters.reset()
+            metrics.reset()
 
             start_time = time.time()
 
@@ -162,6 +614,7 @@ class Handler(BaseHTTPRequestHandler):
             global end_time
 
             end_time = time.time()
+            call_count, max_thread_count = counters.totals()
 
             print('#' * 80)
             log.write('#' * 80)
@@ -178,13 +631,21 @@ class Handler(BaseHTTPRequestHandler):
             print(s := f'Calls per second              : {call_count / (end_time - start_time)}')
             log.write(s)
 
+            record_count = counters.records()
+            print(s := f'Records served                : {record_count}')
+            log.write(s)
+
+            print(s := f'Records per second            : {record_count / (end_time - start_time)}')
+            log.write(s)
+
             data_str = '{' + \
-                       f'"status":"OK", "api": {call_count}, "threads": {max_thread_count}, "total_time": {end_time - start_time}, "calls_per_second": {call_count / (end_time - start_time)}' + \
+                       f'"status":"OK", "api": {call_count}, "threads": {max_thread_count}, "total_time": {end_time - start_time}, "calls_per_second": {call_count / (end_time - start_time)}, "records": {record_count}, "records_per_second": {record_count / (end_time - start_time)}' + \
                        '}'
             json_data = json.dumps(ast.literal_eval(data_str))
 
             print('#' * 80)
             log.write('#' * 80)
+            log.flush()
 
         # CITY DETAILS  ---------------------------------------------------
         elif 'city' in self.path:
@@ -196,8 +657,7 @@ class Handler(BaseHTTPRequestHandler):
                 self.send_response(404)
                 self.send_header("Content-type",  "application/json")
                 self.end_headers()
-                with lock:
-                    thread_count -= 1
+                counters.leave()
                 return
 
             try:
@@ -209,16 +669,14 @@ class Handler(BaseHTTPRequestHandler):
                 self.send_response(404)
                 self.send_header("Content-type",  "application/json")
                 self.end_headers()
-                with lock:
-                    thread_count -= 1
+                counters.leave()
                 return
 
             if name not in cities_data:
                 self.send_response(404)
                 self.send_header("Content-type",  "application/json")
                 self.end_headers()
-                with lock:
-                    thread_count -= 1
+                counters.leave()
                 return
 
             data_str = '{' + \
@@ -226,6 +684,51 @@ class Handler(BaseHTTPRequestHandler):
                        '}'
             json_data = json.dumps(ast.literal_eval(data_str))
 
+        # CITY RECORDS  ---------------------------------------------------
+        elif '/records/' in self.path:
+
+            # one delay for the whole batch, not one per record
+            if SLEEP > 0:
+                time.sleep(SLEEP)
+
+            url = urlsplit(self.path)
+            parts = url.path.split('/')
+            query = parse_qs(url.query)
+            stream = query.get('stream') == ['1']
+
+            try:
+                name = parts[-3].lower()
+                start = int(parts[-2])
+                count = int(parts[-1])
+                # a stream never holds more than one chunk, it isn't capped
+                if not stream:
+                    count = min(count, MAX_RECORDS_PER_CALL)
+            except:
+                name = None
+                start = count = -1
+
+            if len(parts) != 5 or name not in cities_data or start < 0 or count < 0:
+                self.send_response(404)
+                self.send_header("Content-type",  "application/json")
+                self.end_headers()
+                counters.leave()
+                return
+
+            if stream:
+                self.send_records_stream(name, start, count)
+                counters.leave()
+                return
+
+            records = [{"city": name, "date": date_str, "temp": temp}
+                       for date_str, temp in cities_data[name].records(start, count)]
+            counters.add_records(len(records))
+
+            if query.get('format') == ['ndjson']:
+                content_type = "application/x-ndjson"
+                json_data = ''.join(json.dumps(record) + '\n' for record in records)
+            else:
+                json_data = json.dumps(records)
+
         # CITY RECORD  ---------------------------------------------------
         elif 'record' in self.path:
 
@@ -240,8 +743,7 @@ class Handler(BaseHTTPRequestHandler):
                 self.send_response(404)
                 self.send_header("Content-type",  "application/json")
                 self.end_headers()
-                with lock:
-                    thread_count -= 1
+                counters.leave()
                 return
 
             try:
@@ -255,25 +757,18 @@ class Handler(BaseHTTPRequestHandler):
                 self.send_response(404)
                 self.send_header("Content-type",  "application/json")
                 self.end_headers()
-                with lock:
-                    thread_count -= 1
+                counters.leave()
                 return
 
             if name not in cities_data:
                 self.send_response(404)
                 self.send_header("Content-type",  "application/json")
                 self.end_headers()
-                with lock:
-                    thread_count -= 1
+                counters.leave()
                 return
 
-            date_str = cities_data[name][record][0]         # Format "mmdd hhmmss"
-            temp = cities_data[name][record][1]
-
-            # Expand date string to "mm-dd hh:mm:ss"
-            #         01234567890
-            # format "mmdd hhmmss"
-            date_str = date_str[:2] + '-' + date_str[2:4] + ' ' + date_str[5:7] + ':' + date_str[7:9] + ':' + date_str[9:]
+            date_str, temp = cities_data[name].record(record)   # Format "mm-dd hh:mm:ss"
+            counters.add_records(1)
 
             data_str = '{' + \
                        f'"status":"OK", "city": "{name}", "date": "{date_str}", "temp": {temp}' + \
@@ -289,23 +784,43 @@ class Handler(BaseHTTPRequestHandler):
             self.send_header("Content-type",  "application/json")
             self.end_headers()
         else:
-            print('Sending:', json_data)
-            log.write(f'Sending: {json_data}')
+            if not quiet:
+                print('Sending:', json_data)
+                log.write(f'Sending: {json_data}')
 
             self.send_response(200)
-            self.send_header("Content-type",  "application/json")
+            self.send_header("Content-type",  content_type)
             self.end_headers()
             self.wfile.write(bytes(json_data, "utf8"))
 
-        with lock:
-            thread_count -= 1
+        counters.leave()
 
 
+# key = socket fileno, value = time the connection was accepted
+accepted_times = {}
+
 class ThreadingSimpleServer(ThreadingMixIn, HTTPServer):
-    pass
+
+    def process_request(self, request, client_address):
+        accepted_times[request.fileno()] = time.perf_counter()
+        super().process_request(request, client_address)
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Weather server')
+    parser.add_argument('--quiet', action='store_true',
+                        help='no per-request console or log output')
+    parser.add_argument('--async-log', action='store_true',
+                        help='write the log from a background thread in batches')
+    parser.add_argument('--data-cache', action='store_true',
+                        help='keep the parsed city data in data/*.dat.cache files for the next start')
+    args = parser.parse_args()
+
+    quiet = args.quiet
+    data_cache = args.data_cache
+    if args.async_log:
+        log.start_writer()
+
     server = ThreadingSimpleServer((hostName, serverPort), Handler)
     print(f'Starting server.  Waiting on {hostName}:{serverPort}, use <Ctrl-C> or <Command-C> to stop')
     server.serve_forever()
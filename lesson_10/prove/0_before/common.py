@@ -6,46 +6,139 @@ Author: <your name>
 Don't change this code.  You are not submitting it with your assignment
 
 """
+import sys
 import time
+import random
+import logging
+import threading
 import requests
+import requests.adapters
+from array import array
 
 from cse351 import *
 
 TOP_API_URL = 'http://127.0.0.1:8123'
 
 # ----------------------------------------------------------------------------
-def get_data_from_server(url):
-    retries = 50
-    delay = 0.01 # seconds
-    for i in range(retries):
-        try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            if response.status_code == 200:
-                return response.json()
-            break
-
-        except requests.exceptions.ConnectionError as e:
-            if i < retries - 1:
-                time.sleep(delay)
+class PooledClient:
+    """
+    HTTP client shared by every thread.
+
+    - one requests.Session, its adapter keeps up to pool_size open connections
+      so threads reuse them instead of opening a new one for every call
+    - connection errors and timeouts are retried with exponential backoff and
+      jitter, a 429/503 reply waits for the server's Retry-After
+    - budget is the most time one call may take including all of its retries
+    - after breaker_threshold failed attempts in a row the circuit opens and
+      calls return None right away for breaker_cooldown seconds
+    """
+
+    def __init__(self, pool_size=100, retries=50, backoff=0.01, max_backoff=0.5,
+                 timeout=10, budget=30, breaker_threshold=100, breaker_cooldown=5):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.budget = budget
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.open_until = 0
+
+    def get(self, url):
+        deadline = time.perf_counter() + self.budget
+        for attempt in range(self.retries):
+            if self._circuit_open():
+                return None
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+
+            try:
+                response = self.session.get(url, timeout=min(self.timeout, remaining))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self._failed()
+                delay = self._backoff_delay(attempt)
+            except requests.exceptions.RequestException:
+                return None
             else:
-                print("Max retries reached. Failing.")
-                
-        except requests.exceptions.Timeout:
-            ...
-            
-        except requests.exceptions.RequestException as e:
-            break
+                self._succeeded()
+                if response.status_code in (429, 503):
+                    # the server is up but busy, wait as long as it asks
+                    delay = self._retry_after(response, attempt)
+                elif response.status_code == 200:
+                    return response.json()
+                else:
+                    return None
+
+            time.sleep(max(0, min(delay, deadline - time.perf_counter())))
+
+        print("Max retries reached. Failing.")
+        return None
+
+    def _backoff_delay(self, attempt):
+        # "full jitter": a random delay up to the exponential backoff, so
+        # threads that failed together don't all retry together
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _retry_after(self, response, attempt):
+        try:
+            return float(response.headers['Retry-After'])
+        except (KeyError, ValueError):
+            return self._backoff_delay(attempt)
+
+    def _circuit_open(self):
+        with self.lock:
+            return time.perf_counter() < self.open_until
+
+    def _failed(self):
+        with self.lock:
+            self.failures += 1
+            # stays open after the cool down until an attempt succeeds
+            if self.failures >= self.breaker_threshold:
+                self.open_until = time.perf_counter() + self.breaker_cooldown
+
+    def _succeeded(self):
+        with self.lock:
+            self.failures = 0
+            self.open_until = 0
+
+    def close(self):
+        self.session.close()
 
-    return None
+
+# A full pool only means the extra connection is closed after its call
+logging.getLogger('urllib3.connectionpool').setLevel(logging.ERROR)
+
+client = PooledClient()
+
+def configure_client(**options):
+    """ Replace the shared client, ie: configure_client(pool_size=200) """
+    global client
+    client.close()
+    client = PooledClient(**options)
+
+# ----------------------------------------------------------------------------
+def get_data_from_server(url):
+    return client.get(url)
 
 # ----------------------------------------------------------------------------
 class Person:
 
+    # no instance dict and no copy of the JSON, only the fields
+    __slots__ = ('__id', '__name', '__parents', '__family', '__birth')
+
     def __init__(self, data):
         super().__init__()
         self.__id = data['id']
-        self.__name = data['name']
+        self.__name = sys.intern(data['name'])
         self.__parents = data['parent_id']
         self.__family = data['family_id']
         self.__birth = data['birth']
@@ -77,12 +170,14 @@ class Person:
 # ----------------------------------------------------------------------------
 class Family:
 
+    __slots__ = ('__id', '__husband', '__wife', '__children')
+
     def __init__(self, data):
         super().__init__()
         self.__id = data['id']
         self.__husband = data['husband_id']
         self.__wife = data['wife_id']
-        self.__children = data['children']
+        self.__children = tuple(data['children'])
 
     def children_count(self):
         return len(self.__children)
@@ -105,167 +200,397 @@ class Family:
         return self.__wife
 
     def get_children(self):
-        return self.__children
+        return list(self.__children)
+
+
+# ----------------------------------------------------------------------------
+# Ids in the Tree columns, None is stored as NO_ID
+NO_ID = -1
+
+# Lines joined into one log.write() by Tree.display()
+DISPLAY_CHUNK_LINES = 1000
+
+def _to_column(id):
+    return NO_ID if id is None else id
+
+def _from_column(id):
+    return None if id == NO_ID else id
+
+def _pack_birth(birth):
+    # 'day-month-year' as one int (yyyymmdd), NO_ID if it has another format
+    parts = birth.split('-')
+    if len(parts) == 3 and all(part.isdigit() for part in parts):
+        day, month, year = (int(part) for part in parts)
+        if f'{day}-{month}-{year}' == birth and day < 100 and month < 100:
+            return year * 10000 + month * 100 + day
+    return NO_ID
+
+def _unpack_birth(packed):
+    year, month_day = divmod(packed, 10000)
+    month, day = divmod(month_day, 100)
+    return f'{day}-{month}-{year}'
+
+
+class PersonView:
+    """ A person stored in a Tree, same getters as Person """
+
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    def get_id(self):
+        return self.tree.person_ids[self.index]
+
+    def get_name(self):
+        return self.tree.person_names[self.index]
+
+    def get_birth(self):
+        return self.tree.get_birth(self.index)
+
+    def get_parentid(self):
+        return _from_column(self.tree.person_parents[self.index])
+
+    def get_familyid(self):
+        return _from_column(self.tree.person_families[self.index])
+
+    def __str__(self):
+        output  = f'id        : {self.get_id()}\n'
+        output += f'name      : {self.get_name()}\n'
+        output += f'birth     : {self.get_birth()}\n'
+        output += f'parent id : {self.get_parentid()}\n'
+        output += f'family id : {self.get_familyid()}\n'
+        return output
+
+
+class FamilyView:
+    """ A family stored in a Tree, same getters as Family """
+
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    def get_id(self):
+        return self.tree.family_ids[self.index]
+
+    def get_husband(self):
+        return _from_column(self.tree.family_husbands[self.index])
+
+    def get_wife(self):
+        return _from_column(self.tree.family_wives[self.index])
+
+    def get_children(self):
+        start = self.tree.family_first_child[self.index]
+        return self.tree.children[start:start + self.children_count()].tolist()
+
+    def children_count(self):
+        return self.tree.family_child_count[self.index]
+
+    def __str__(self):
+        output  = f'id         : {self.get_id()}\n'
+        output += f'husband    : {self.get_husband()}\n'
+        output += f'wife       : {self.get_wife()}\n'
+        for id in self.get_children():
+            output += f'  Child    : {id}\n'
+        return output
 
 
 # -----------------------------------------------------------------------------
 class Tree:
-
-    def __init__(self, start_family_id):
+    """
+    People and families are kept as columns (struct of arrays): one array
+    per field, and a dict from id to the row index.  A row costs a few
+    machine words instead of an object with its own dict, which matters for
+    10+ generations.  get_person() and get_family() return small views with
+    the same getters as Person and Family.
+
+    With incremental=True the tree keeps the generation count and the people
+    connected to the start family up to date as people and families are
+    added, so the statistics at the end of a run cost nothing.
+    """
+
+    def __init__(self, start_family_id, incremental=False):
         super().__init__()
-        self.__people = {}
-        self.__families = {}
         self.__start_family_id = start_family_id
+        self.__incremental = incremental
+
+        # incremental statistics
+        self.__depth = {}            # family id -> generation, for families connected to the start
+        self.__max_depth = -1
+        self.__connected = set()     # person ids connected to the start family
+        self.__spouse_family = {}    # person id -> family they are husband or wife of
+        self.__children_of = {}      # family id -> ids of people with it as parents
+
+        self.__person_index = {}
+        self.person_ids = array('q')
+        self.person_names = []
+        self.person_births = array('i')
+        self.person_birth_text = {}   # row index -> birth that isn't day-month-year
+        self.person_parents = array('q')
+        self.person_families = array('q')
+
+        self.__family_index = {}
+        self.family_ids = array('q')
+        self.family_husbands = array('q')
+        self.family_wives = array('q')
+        self.family_first_child = array('q')
+        self.family_child_count = array('H')
+        self.children = array('q')
 
     def add_person(self, person):
         if self.does_person_exist(person.get_id()):
             print(f'ERROR: Person with ID = {person.get_id()} Already exists in the tree')
         else:
-            self.__people[person.get_id()] = person
+            self.__person_index[person.get_id()] = len(self.person_ids)
+            self.person_ids.append(person.get_id())
+            self.person_names.append(sys.intern(person.get_name()))
+            birth = person.get_birth()
+            packed = _pack_birth(birth)
+            if packed == NO_ID:
+                self.person_birth_text[len(self.person_births)] = birth
+            self.person_births.append(packed)
+            self.person_parents.append(_to_column(person.get_parentid()))
+            self.person_families.append(_to_column(person.get_familyid()))
+            if self.__incremental:
+                self._person_added(person.get_id(), person.get_parentid())
 
     def add_family(self, family):
         if self.does_family_exist(family.get_id()):
             print(f'ERROR: Family with ID = {family.get_id()} Already exists in the tree')
         else:
-            self.__families[family.get_id()] = family
+            children = family.get_children()
+            self.__family_index[family.get_id()] = len(self.family_ids)
+            self.family_ids.append(family.get_id())
+            self.family_husbands.append(_to_column(family.get_husband()))
+            self.family_wives.append(_to_column(family.get_wife()))
+            self.family_first_child.append(len(self.children))
+            self.family_child_count.append(len(children))
+            self.children.extend(children)
+            if self.__incremental:
+                self._family_added(family.get_id(), family.get_husband(), family.get_wife())
+
+    def add_many(self, people=(), families=()):
+        """ Add lists of people and families, the ones already in the tree are skipped """
+        for person in people:
+            if not self.does_person_exist(person.get_id()):
+                self.add_person(person)
+        for family in families:
+            if not self.does_family_exist(family.get_id()):
+                self.add_family(family)
 
     def get_person(self, id):
-        if id in self.__people:
-            return self.__people[id]
-        else:
-            return None
+        index = self.__person_index.get(id)
+        return None if index is None else PersonView(self, index)
 
     def get_family(self, id):
-        if id in self.__families:
-            return self.__families[id]
-        else:
-            return None
+        index = self.__family_index.get(id)
+        return None if index is None else FamilyView(self, index)
+
+    def get_birth(self, index):
+        packed = self.person_births[index]
+        return self.person_birth_text[index] if packed == NO_ID else _unpack_birth(packed)
 
     def get_person_count(self):
-        return len(self.__people)
+        return len(self.__person_index)
 
     def get_family_count(self):
-        return len(self.__families)
+        return len(self.__family_index)
 
     def does_person_exist(self, id):
-        return id in self.__people
+        return id in self.__person_index
 
     def does_family_exist(self, id):
-        return id in self.__families
-
-    def display(self, log):
-        log.write('\n\n')
-        log.write(f'{" TREE DISPLAY ":*^40}')
-        for family_id in self.__families:
-            fam = self.__families[family_id]
-
-            log.write(f'Family id: {family_id}')
-
-            # Husband
-            husband = self.get_person(fam.get_husband())
-            if husband == None:
-                log.write(f'  Husband: None')
-            else:
-                log.write(f'  Husband: {husband.get_name()}, {husband.get_birth()}')
-
-            # wife
-            wife = self.get_person(fam.get_wife())
-            if wife == None:
-                log.write(f'  Wife: None')
-            else:
-                log.write(f'  Wife: {wife.get_name()}, {wife.get_birth()}')
-
-            # Parents of Husband
-            if husband == None:
-                log.write(f'  Husband Parents: None')
-            else:
-                parent_fam_id = husband.get_parentid()
-                if parent_fam_id in self.__families:
-                    parent_fam = self.get_family(parent_fam_id)
-                    father = self.get_person(parent_fam.get_husband())
-                    mother = self.get_person(parent_fam.get_wife())
-                    log.write(f'  Husband Parents: {father.get_name()} and {mother.get_name()}')
-                else:
-                    log.write(f'  Husband Parents: None')
-
-            # Parents of Wife
-            if wife == None:
-                log.write(f'  Wife Parents: None')
-            else:
-                parent_fam_id = wife.get_parentid()
-                if parent_fam_id in self.__families:
-                    parent_fam = self.get_family(parent_fam_id)
-                    father = self.get_person(parent_fam.get_husband())
-                    mother = self.get_person(parent_fam.get_wife())
-                    log.write(f'  Wife Parents: {father.get_name()} and {mother.get_name()}')
-                else:
-                    log.write(f'  Wife Parents: None')
-
-            # children
-            output = []
-            for index, child_id in enumerate(fam.get_children()):
-                person = self.__people[child_id]
-                output.append(f'{person.get_name()}')
-            out_str = str(output).replace("'", '', 100)
-            log.write(f'  Children: {out_str[1:-1]}')
+        return id in self.__family_index
+
+    def get_generation_count(self):
+        if self.__incremental:
+            return self.__max_depth + 1
+        return self._count_generations(self.__start_family_id)
+
+    def get_connected_count(self):
+        if self.__incremental:
+            return len(self.__connected)
+        return self._test_number_connected_to_start()
+
+    def get_family_ids(self):
+        """ Family ids in the order they were added """
+        return self.family_ids.tolist()
+
+    def nbytes(self):
+        """ Bytes used by the array columns (names are shared strings) """
+        columns = (self.person_ids, self.person_births, self.person_parents, self.person_families, self.family_ids,
+                   self.family_husbands, self.family_wives, self.family_first_child,
+                   self.family_child_count, self.children)
+        return sum(column.itemsize * len(column) for column in columns)
+
+    def display(self, log, summary_only=False, path=None, chunk_lines=DISPLAY_CHUNK_LINES):
+        """
+        Writes every family and then the summary to the log.  The family lines
+        are joined and written chunk_lines at a time instead of one write per
+        line.  With path they are streamed to that file instead, and with
+        summary_only only the summary is written.
+        """
+        if summary_only:
+            pass
+        elif path is not None:
+            with open(path, 'w', buffering=1 << 20) as file:
+                file.writelines(f'{line}\n' for line in self._display_lines())
+            log.write(f'Tree written to {path}')
+        else:
+            chunk = []
+            for line in self._display_lines():
+                chunk.append(line)
+                if len(chunk) >= chunk_lines:
+                    log.write('\n'.join(chunk))
+                    chunk = []
+            if chunk:
+                log.write('\n'.join(chunk))
 
         log.write('')
-        log.write(f'Number of people                    : {len(self.__people)}')
-        log.write(f'Number of families                  : {len(self.__families)}')
-        log.write(f'Max generations                     : {self._count_generations(self.__start_family_id)}')
-        log.write(f'People connected to starting family : {self._test_number_connected_to_start()}')
-
+        log.write(f'Number of people                    : {self.get_person_count()}')
+        log.write(f'Number of families                  : {self.get_family_count()}')
+        log.write(f'Max generations                     : {self.get_generation_count()}')
+        log.write(f'People connected to starting family : {self.get_connected_count()}')
+
+    def _display_lines(self):
+        """ The lines of display(), read straight from the columns """
+        names = self.person_names
+        people = self.__person_index
+        families = self.__family_index
+        # 'father and mother' of each parent family, worked out once
+        parent_names = {}
+
+        def person_row(id):
+            return people.get(_from_column(id))
+
+        def parents_text(row):
+            family_id = _from_column(self.person_parents[row])
+            text = parent_names.get(family_id)
+            if text is None:
+                if family_id not in families:
+                    text = 'None'
+                else:
+                    index = families[family_id]
+                    father = person_row(self.family_husbands[index])
+                    mother = person_row(self.family_wives[index])
+                    text = f'{"None" if father is None else names[father]} and {"None" if mother is None else names[mother]}'
+                parent_names[family_id] = text
+            return text
+
+        yield '\n\n'
+        yield f'{" TREE DISPLAY ":*^40}'
+        for index, family_id in enumerate(self.family_ids):
+            yield f'Family id: {family_id}'
+
+            husband = person_row(self.family_husbands[index])
+            wife = person_row(self.family_wives[index])
+            yield '  Husband: None' if husband is None else f'  Husband: {names[husband]}, {self.get_birth(husband)}'
+            yield '  Wife: None' if wife is None else f'  Wife: {names[wife]}, {self.get_birth(wife)}'
+            yield f'  Husband Parents: {"None" if husband is None else parents_text(husband)}'
+            yield f'  Wife Parents: {"None" if wife is None else parents_text(wife)}'
+
+            first = self.family_first_child[index]
+            children = self.children[first:first + self.family_child_count[index]]
+            yield '  Children: ' + ', '.join(names[people[id]] for id in children if id in people)
+
+    def _parent_families(self, family_id):
+        """ Ids of the parent families of the husband and wife that are in the tree """
+        fam = self.get_family(family_id)
+        for spouse_id in (fam.get_husband(), fam.get_wife()):
+            spouse = self.get_person(spouse_id)
+            if spouse != None and self.does_family_exist(spouse.get_parentid()):
+                yield spouse.get_parentid()
 
     def _test_number_connected_to_start(self):
-        # start with first family, how many connected to that family
+        # start with first family, how many connected to that family.
+        # A stack instead of recursion, and every family is visited once
+        # even when it is an ancestor along more than one line.
         inds_seen = set()
+        families_seen = set()
+        stack = [self.__start_family_id]
+
+        while stack:
+            family_id = stack.pop()
+            if family_id in families_seen or not self.does_family_exist(family_id):
+                continue
+            families_seen.add(family_id)
+
+            fam = self.get_family(family_id)
+            for spouse_id in (fam.get_husband(), fam.get_wife()):
+                spouse = self.get_person(spouse_id)
+                if spouse != None:
+                    inds_seen.add(spouse_id)
+                    stack.append(spouse.get_parentid())
+            inds_seen.update(fam.get_children())
 
-        def _recurive(family_id):
-            nonlocal inds_seen
-            if family_id in self.__families:
-                # count people in this family
-                fam = self.__families[family_id]
-
-                husband = self.get_person(fam.get_husband())
-                if husband != None:
-                    if husband.get_id() not in inds_seen:
-                        inds_seen.add(husband.get_id())
-                    _recurive(husband.get_parentid())
-                
-                wife = self.get_person(fam.get_wife())
-                if wife != None:
-                    if wife.get_id() not in inds_seen:
-                        inds_seen.add(wife.get_id())
-                    _recurive(wife.get_parentid())
-
-                for child_id in fam.get_children():
-                    if child_id not in inds_seen:
-                        inds_seen.add(child_id)
-
-
-        _recurive(self.__start_family_id)
         return len(inds_seen)
 
-
     def _count_generations(self, family_id):
-        max_gen = -1
-
-        def _recurive_gen(id, gen):
-            nonlocal max_gen
-            if id in self.__families:
-                if max_gen < gen:
-                    max_gen = gen
-
-                fam = self.__families[id]
-
-                husband = self.get_person(fam.get_husband())
-                if husband != None:
-                    _recurive_gen(husband.get_parentid(), gen + 1)
-                
-                wife = self.get_person(fam.get_wife())
-                if wife != None:
-                    _recurive_gen(wife.get_parentid(), gen + 1)
-
-        _recurive_gen(family_id, 0)
-        return max_gen + 1
-
+        # generations = the longest line of parent families.  Post order on a
+        # stack: a family's height is 1 + the highest of its parent families,
+        # and each height is worked out once.
+        heights = {}
+        stack = [(family_id, False)]
+
+        while stack:
+            id, parents_done = stack.pop()
+            if id in heights or not self.does_family_exist(id):
+                continue
+
+            parents = list(self._parent_families(id))
+            if parents_done:
+                heights[id] = 1 + max((heights[parent] for parent in parents), default=0)
+            else:
+                stack.append((id, True))
+                stack.extend((parent, False) for parent in parents if parent not in heights)
+
+        return heights.get(family_id, 0)
+
+    def _family_added(self, family_id, husband_id, wife_id):
+        for spouse_id in (husband_id, wife_id):
+            if spouse_id is not None:
+                self.__spouse_family[spouse_id] = family_id
+
+        if family_id == self.__start_family_id:
+            self._reach(family_id, 0)
+            return
+
+        # connected if a husband or wife of a connected family has it as parents
+        for person_id in self.__children_of.get(family_id, ()):
+            child_family = self.__spouse_family.get(person_id)
+            if child_family in self.__depth:
+                self._reach(family_id, self.__depth[child_family] + 1)
+
+    def _person_added(self, person_id, parent_id):
+        if parent_id is not None:
+            self.__children_of.setdefault(parent_id, []).append(person_id)
+
+        family_id = self.__spouse_family.get(person_id)
+        if family_id in self.__depth:
+            self.__connected.add(person_id)
+            if self.does_family_exist(parent_id):
+                self._reach(parent_id, self.__depth[family_id] + 1)
+
+    def _reach(self, family_id, depth):
+        """ family_id is connected to the start at depth, pass it on to its parents """
+        stack = [(family_id, depth)]
+        while stack:
+            id, depth = stack.pop()
+            if self.__depth.get(id, -1) >= depth:
+                continue
+            first_time = id not in self.__depth
+            self.__depth[id] = depth
+            self.__max_depth = max(self.__max_depth, depth)
+
+            fam = self.get_family(id)
+            if first_time:
+                self.__connected.update(fam.get_children())
+                for spouse_id in (fam.get_husband(), fam.get_wife()):
+                    if self.does_person_exist(spouse_id):
+                        self.__connected.add(spouse_id)
+
+            for parent_id in self._parent_families(id):
+                stack.append((parent_id, depth + 1))
@@ -0,0 +1,234 @@
+"""
+Course: CSE 351
+Lesson Week: 10
+File: async_crawler.py
+Author: Dawson Packer
+Purpose: Assignment 10 - Family Search, asyncio crawler
+
+The same three searches as functions.py (depth first, breadth first and
+breadth first with a limit on concurrent calls) written with asyncio.  Every
+fetch is a coroutine instead of a thread, so thousands of requests in flight
+cost very little.  All requests go through one AsyncClient, a small HTTP/1.1
+client that keeps a pool of open connections (start the server with
+--keep-alive to reuse them) and retries connection errors and 429/503
+replies like get_data_from_server() does.  The limited version gates the fetches with an
+asyncio.Semaphore.
+
+The *_pedigree() functions at the bottom take (family_id, tree) and can be
+passed to run_part() in prove.py like the threaded versions.
+"""
+from common import *
+import asyncio
+import json
+import random
+from urllib.parse import urlsplit
+
+# Most connections open at the same time, more fetches than this wait.
+# The threaded server only queues a few connections it hasn't accepted yet,
+# opening hundreds at once leaves some of them stuck until they time out.
+ASYNC_MAX_CONNECTIONS = 50
+ASYNC_LIMIT = 5
+
+
+# -----------------------------------------------------------------------------
+class AsyncClient:
+
+    retries = 50
+    backoff = 0.01      # seconds, doubles with every retry
+    max_backoff = 0.5
+    timeout = 5         # seconds for one request, then it is retried
+
+    def __init__(self, base_url=TOP_API_URL, max_connections=ASYNC_MAX_CONNECTIONS):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.idle = []
+        self.slots = asyncio.Semaphore(max_connections)
+
+    async def get_data(self, url):
+        """ JSON reply of a GET, None if the server doesn't return 200 """
+        url = urlsplit(url)
+        path = url.path or '/'
+        if url.query:
+            path += '?' + url.query
+
+        for i in range(self.retries):
+            async with self.slots:
+                connection = self.idle.pop() if self.idle else None
+                try:
+                    if connection is None:
+                        connection = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+                    status, headers, body, reusable = await asyncio.wait_for(self._request(connection, path), self.timeout)
+                except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+                    # includes a kept-alive connection the server has closed
+                    if connection is not None:
+                        connection[1].close()
+                    status = None
+                else:
+                    if reusable:
+                        self.idle.append(connection)
+                    else:
+                        connection[1].close()
+
+            # the waits are outside the slot, a fetch that is backing off
+            # doesn't keep a connection from the others
+            if status is None:
+                await asyncio.sleep(self._backoff_delay(i))
+                continue
+            if status == 200:
+                return json.loads(body)
+            if status in (429, 503):
+                # the server is up but busy, wait as long as it asks
+                await asyncio.sleep(self._retry_after(headers, i))
+                continue
+            return None
+
+        print("Max retries reached. Failing.")
+        return None
+
+    def _backoff_delay(self, attempt):
+        # "full jitter", like PooledClient
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _retry_after(self, headers, attempt):
+        try:
+            return float(headers['retry-after'])
+        except (KeyError, ValueError):
+            return self._backoff_delay(attempt)
+
+    async def _request(self, connection, path):
+        reader, writer = connection
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nConnection: keep-alive\r\n\r\n'.encode('latin-1'))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('connection closed by server')
+        version, status, _ = status_line.decode('latin-1').split(' ', 2)
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+
+        reusable = version == 'HTTP/1.1' and headers.get('connection') != 'close'
+        if 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        else:
+            body = await reader.read()
+            reusable = False
+        return int(status), headers, body, reusable
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+
+# -----------------------------------------------------------------------------
+class AsyncCrawl:
+    """ State of one crawl: the tree, the client and the ids already taken """
+
+    def __init__(self, tree, client, limit=None):
+        self.tree = tree
+        self.client = client
+        self.gate = asyncio.Semaphore(limit) if limit else None
+        self.families_seen = set()
+        self.people_seen = set()
+
+    async def fetch(self, url):
+        if self.gate is None:
+            return await self.client.get_data(url)
+        async with self.gate:
+            return await self.client.get_data(url)
+
+    async def get_family(self, family_id):
+        """
+        Fetch and add a family, returns it or None if it was taken or missing.
+        An id is marked as taken while it is fetched so it is only fetched
+        once, and unmarked again if the fetch fails.
+        """
+        if family_id is None or family_id in self.families_seen:
+            return None
+        self.families_seen.add(family_id)
+
+        family_data = await self.fetch(f'{TOP_API_URL}/family/{family_id}')
+        if family_data is None:
+            # not taken after all, a later reference can try again
+            self.families_seen.discard(family_id)
+            return None
+
+        family = Family(family_data)
+        self.tree.add_family(family)
+        return family
+
+    async def get_person(self, person_id):
+        if person_id is None or person_id in self.people_seen:
+            return None
+        self.people_seen.add(person_id)
+
+        person_data = await self.fetch(f'{TOP_API_URL}/person/{person_id}')
+        if person_data is None:
+            self.people_seen.discard(person_id)
+            return None
+
+        person = Person(person_data)
+        self.tree.add_person(person)
+        return person
+
+    async def get_members(self, family):
+        """ Fetch the husband, wife and children, returns the parent family ids """
+        person_ids = [family.get_husband(), family.get_wife()] + family.get_children()
+        people = await asyncio.gather(*(self.get_person(id) for id in person_ids))
+
+        parent_ids = []
+        for person in people:
+            if person is not None and person.get_parentid() is not None and person.get_parentid() not in parent_ids:
+                parent_ids.append(person.get_parentid())
+        return parent_ids
+
+    async def depth_first(self, family_id):
+        family = await self.get_family(family_id)
+        if family is None:
+            return
+
+        parent_ids = await self.get_members(family)
+        await asyncio.gather(*(self.depth_first(id) for id in parent_ids))
+
+    async def breadth_first(self, family_id):
+        current_level = [family_id]
+
+        while current_level:
+            families = await asyncio.gather(*(self.get_family(id) for id in current_level))
+            members = await asyncio.gather(*(self.get_members(family) for family in families if family is not None))
+
+            next_level = set()
+            for parent_ids in members:
+                next_level.update(id for id in parent_ids if id not in self.families_seen)
+            current_level = list(next_level)
+
+
+async def _crawl(family_id, tree, depth_first, limit=None):
+    client = AsyncClient()
+    crawl = AsyncCrawl(tree, client, limit)
+    try:
+        if depth_first:
+            await crawl.depth_first(family_id)
+        else:
+            await crawl.breadth_first(family_id)
+    finally:
+        client.close()
+
+
+# -----------------------------------------------------------------------------
+def async_depth_fs_pedigree(family_id, tree):
+    asyncio.run(_crawl(family_id, tree, depth_first=True))
+
+def async_breadth_fs_pedigree(family_id, tree):
+    asyncio.run(_crawl(family_id, tree, depth_first=False))
+
+def async_breadth_fs_pedigree_limit5(family_id, tree):
+    asyncio.run(_crawl(family_id, tree, depth_first=False, limit=ASYNC_LIMIT))
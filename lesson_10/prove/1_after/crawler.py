@@ -0,0 +1,183 @@
+"""
+Course: CSE 351
+Lesson Week: 10
+File: crawler.py
+Author: Dawson Packer
+Purpose: Assignment 10 - Family Search, worker pool crawler
+
+depth_fs_pedigree() and breadth_fs_pedigree() start a new thread for every
+person and every parent family, so the number of threads grows with the size
+of the tree.  PoolCrawler starts a fixed number of worker threads once.  The
+workers share one queue of ('family', id) and ('person', id) tasks:
+
+- a family task fetches the family, adds it to the tree and queues a person
+  task for the husband, wife and each child
+- a person task fetches the person, adds them to the tree and queues a
+  family task for their parents
+
+The result is the same Tree, but thread creation cost and the peak thread
+count depend only on the number of workers.
+
+StreamingCrawler is a breadth first search without the per-generation
+barrier of breadth_fs_pedigree().  A parent family is queued as soon as the
+child's person record arrives, so the next generation overlaps the tail of
+the current one and one slow family doesn't stall the whole level.  The
+tasks are kept in a PriorityQueue by (generation, order queued), so breadth
+first is only the order the workers pick tasks in, not something they wait
+for.
+
+AdaptiveCrawler is the streaming search with more workers, but the calls
+they make go through the AdaptiveGate in common.py.  The gate starts at a
+few calls in flight and raises or cuts the limit from the latency and
+errors it sees, so the best number of calls for the server is found while
+crawling instead of being tuned by hand.
+"""
+from common import *
+import itertools
+import math
+import queue
+import threading
+import time
+
+POOL_WORKERS = 50
+ADAPTIVE_WORKERS = 100
+
+FAMILY = 'family'
+PERSON = 'person'
+
+
+# -----------------------------------------------------------------------------
+class PoolCrawler:
+
+    def __init__(self, tree, workers=POOL_WORKERS):
+        self.tree = tree
+        self.workers = workers
+        self.tasks = queue.Queue()
+        self.lock = threading.Lock()
+        self.order = itertools.count()
+        # ids already queued, so nothing is fetched twice
+        self.families_queued = set()
+        self.people_queued = set()
+
+    def crawl(self, family_id):
+        self.add_family(family_id, 0)
+
+        threads = [threading.Thread(target=self._worker, name=f'crawler-{i + 1}') for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        # every task is queued before the task that found it is done,
+        # so the queue is only empty once the whole tree is fetched
+        self.tasks.join()
+
+        for _ in threads:
+            self.tasks.put((math.inf, next(self.order), None, None, None))
+        for thread in threads:
+            thread.join()
+
+    def add_family(self, family_id, generation):
+        if family_id is None:
+            return
+        with self.lock:
+            if family_id in self.families_queued:
+                return
+            self.families_queued.add(family_id)
+            order = next(self.order)
+        self.tasks.put((generation, order, FAMILY, family_id, time.perf_counter()))
+
+    def add_person(self, person_id, generation):
+        if person_id is None:
+            return
+        with self.lock:
+            if person_id in self.people_queued:
+                return
+            self.people_queued.add(person_id)
+            order = next(self.order)
+        self.tasks.put((generation, order, PERSON, person_id, time.perf_counter()))
+
+    def _worker(self):
+        while True:
+            generation, _, kind, id, queued = self.tasks.get()
+            if kind is None:
+                self.tasks.task_done()
+                break
+            tracer.add_wait(time.perf_counter() - queued)
+
+            try:
+                if kind == FAMILY:
+                    self._fetch_family(id, generation)
+                else:
+                    self._fetch_person(id, generation)
+            finally:
+                self.tasks.task_done()
+
+    def fetch(self, url):
+        return get_data_from_server(url)
+
+    def _fetch_family(self, family_id, generation):
+        family_data = self.fetch(f'{TOP_API_URL}/family/{family_id}')
+        if family_data is None:
+            return
+
+        family = Family(family_data)
+        with self.lock:
+            if not self.tree.does_family_exist(family_id):
+                self.tree.add_family(family)
+
+        self.add_person(family.get_husband(), generation)
+        self.add_person(family.get_wife(), generation)
+        for child_id in family.get_children():
+            self.add_person(child_id, generation)
+
+    def _fetch_person(self, person_id, generation):
+        person_data = self.fetch(f'{TOP_API_URL}/person/{person_id}')
+        if person_data is None:
+            return
+
+        person = Person(person_data)
+        with self.lock:
+            if not self.tree.does_person_exist(person_id):
+                self.tree.add_person(person)
+
+        # the parents are one generation further from the start family
+        self.add_family(person.get_parentid(), generation + 1)
+
+
+# -----------------------------------------------------------------------------
+class StreamingCrawler(PoolCrawler):
+
+    def __init__(self, tree, workers=POOL_WORKERS):
+        super().__init__(tree, workers)
+        # lowest generation first, ties in the order they were found
+        self.tasks = queue.PriorityQueue()
+
+
+# -----------------------------------------------------------------------------
+class AdaptiveCrawler(StreamingCrawler):
+
+    def __init__(self, tree, workers=ADAPTIVE_WORKERS):
+        super().__init__(tree, workers)
+
+    def crawl(self, family_id):
+        # more permits than workers could never be used, the shared gate
+        # gets its own maximum back when the crawl is over
+        maximum = gate.maximum
+        gate.maximum = min(maximum, self.workers)
+        try:
+            super().crawl(family_id)
+        finally:
+            gate.maximum = maximum
+
+    def fetch(self, url):
+        return gate.fetch(url)
+
+
+# -----------------------------------------------------------------------------
+def pool_fs_pedigree(family_id, tree, workers=POOL_WORKERS):
+    PoolCrawler(tree, workers).crawl(family_id)
+
+def streaming_bfs_pedigree(family_id, tree, workers=POOL_WORKERS):
+    StreamingCrawler(tree, workers).crawl(family_id)
+
+def adaptive_bfs_pedigree(family_id, tree, workers=ADAPTIVE_WORKERS):
+    AdaptiveCrawler(tree, workers).crawl(family_id)
@@ -93,6 +93,7 @@ still achieving good performance.
 from common import *
 import queue
 import threading
+import time
 
 # -----------------------------------------------------------------------------
 def depth_fs_pedigree(family_id, tree):
@@ -112,7 +113,7 @@ def depth_fs_pedigree(family_id, tree):
                 return
 
         # Get family data from server
-        family_data = get_data_from_server(f'{TOP_API_URL}/family/{fam_id}')
+        family_data = get_data_once(f'{TOP_API_URL}/family/{fam_id}')
         if family_data is None:
             return
 
@@ -120,8 +121,10 @@ def depth_fs_pedigree(family_id, tree):
 
         # Add family to tree (thread-safe)
         with lock:
-            if not tree.does_family_exist(fam_id):
-                tree.add_family(family_obj)
+            # another thread got the same family and fetches its people
+            if tree.does_family_exist(fam_id):
+                return
+            tree.add_family(family_obj)
 
         # Get all person IDs we need to fetch
         person_ids = []
@@ -136,7 +139,7 @@ def depth_fs_pedigree(family_id, tree):
         people_data = {}
 
         def fetch_person(person_id):
-            person_data = get_data_from_server(f'{TOP_API_URL}/person/{person_id}')
+            person_data = get_data_once(f'{TOP_API_URL}/person/{person_id}')
             if person_data is not None:
                 with lock:
                     people_data[person_id] = person_data
@@ -151,7 +154,7 @@ def depth_fs_pedigree(family_id, tree):
             thread.join()
 
         # Add all people to tree
-        parent_ids = []
+        parent_ids = set()
         for person_id, person_data in people_data.items():
             person_obj = Person(person_data)
             with lock:
@@ -160,8 +163,8 @@ def depth_fs_pedigree(family_id, tree):
 
             # Collect parent family IDs for recursion
             parent_fam_id = person_obj.get_parentid()
-            if parent_fam_id is not None and parent_fam_id not in parent_ids:
-                parent_ids.append(parent_fam_id)
+            if parent_fam_id is not None:
+                parent_ids.add(parent_fam_id)
 
         # Recursively process parent families in parallel
         parent_threads = []
@@ -187,7 +190,7 @@ def breadth_fs_pedigree(family_id, tree):
     current_level = [family_id]
 
     while current_level:
-        next_level = []
+        next_level = set()
         level_threads = []
 
         def process_family(fam_id):
@@ -200,7 +203,7 @@ def breadth_fs_pedigree(family_id, tree):
                     return
 
             # Get family data
-            family_data = get_data_from_server(f'{TOP_API_URL}/family/{fam_id}')
+            family_data = get_data_once(f'{TOP_API_URL}/family/{fam_id}')
             if family_data is None:
                 return
 
@@ -208,8 +211,10 @@ def breadth_fs_pedigree(family_id, tree):
 
             # Add family to tree (thread-safe)
             with lock:
-                if not tree.does_family_exist(fam_id):
-                    tree.add_family(family_obj)
+                # another thread got the same family and fetches its people
+                if tree.does_family_exist(fam_id):
+                    return
+                tree.add_family(family_obj)
 
             # Get all person IDs
             person_ids = []
@@ -224,7 +229,7 @@ def breadth_fs_pedigree(family_id, tree):
             people_data = {}
 
             def fetch_person(person_id):
-                person_data = get_data_from_server(f'{TOP_API_URL}/person/{person_id}')
+                person_data = get_data_once(f'{TOP_API_URL}/person/{person_id}')
                 if person_data is not None:
                     with lock:
                         people_data[person_id] = person_data
@@ -249,8 +254,8 @@ def breadth_fs_pedigree(family_id, tree):
                 parent_fam_id = person_obj.get_parentid()
                 if parent_fam_id is not None:
                     with lock:
-                        if parent_fam_id not in next_level and not tree.does_family_exist(parent_fam_id):
-                            next_level.append(parent_fam_id)
+                        if not tree.does_family_exist(parent_fam_id):
+                            next_level.add(parent_fam_id)
 
         # Process all families in current level in parallel
         for fam_id in current_level:
@@ -276,12 +281,18 @@ def breadth_fs_pedigree_limit5(family_id, tree):
     semaphore = threading.Semaphore(5)
     current_level = [family_id]
 
-    def get_data_limited(url):
+    def fetch_limited(url):
+        waiting = time.perf_counter()
         with semaphore:
+            tracer.add_wait(time.perf_counter() - waiting)
             return get_data_from_server(url)
 
+    def get_data_limited(url):
+        # a duplicate waits for the first call without taking a permit
+        return get_data_once(url, fetch_limited)
+
     while current_level:
-        next_level = []
+        next_level = set()
         level_threads = []
 
         def process_family(fam_id):
@@ -302,8 +313,10 @@ def breadth_fs_pedigree_limit5(family_id, tree):
 
             # Add family to tree (thread-safe)
             with lock:
-                if not tree.does_family_exist(fam_id):
-                    tree.add_family(family_obj)
+                # another thread got the same family and fetches its people
+                if tree.does_family_exist(fam_id):
+                    return
+                tree.add_family(family_obj)
 
             # Get all person IDs
             person_ids = []
@@ -343,8 +356,8 @@ def breadth_fs_pedigree_limit5(family_id, tree):
                 parent_fam_id = person_obj.get_parentid()
                 if parent_fam_id is not None:
                     with lock:
-                        if parent_fam_id not in next_level and not tree.does_family_exist(parent_fam_id):
-                            next_level.append(parent_fam_id)
+                        if not tree.does_family_exist(parent_fam_id):
+                            next_level.add(parent_fam_id)
 
         # Process all families in current level in parallel (API calls limited by semaphore)
         for fam_id in current_level:
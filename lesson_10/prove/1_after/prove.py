@@ -4,33 +4,83 @@ Lesson Week: 10
 File: assignment.py
 Author: <your name>
 Purpose: Assignment 10 - Family Search
+
+runs.txt has one run per line: part number, number of generations
+    1 = depth first, 2 = breadth first, 3 = breadth first limit 5
+    4 = worker pool crawler (crawler.py)
+    5 = asyncio depth first, 6 = asyncio breadth first,
+    7 = asyncio breadth first limit 5 (async_crawler.py)
+    8 = streaming breadth first, no per-generation barrier (crawler.py)
+    9 = streaming breadth first through the adaptive (AIMD) gate (crawler.py)
+
+The people and families can be kept in a cache file (see DiskCache in
+common.py).  Run the server with --seed so the tree is the same each time:
+    python prove.py --cache read-through         first run crawls and saves
+    python prove.py --cache cache-only           later runs skip the server
+    python prove.py --cache write-through --invalidate
+cache-only takes the starting family id from the cache file.  The asyncio
+parts talk to the server directly and don't use the cache, cache-only skips
+them.
+
+For benchmark runs --summary skips printing the families of the tree, and
+--display-file tree.txt writes them to that file instead of the log.
+
+--trace trace.json records every fetch and writes a Chrome trace timeline
+(open it in chrome://tracing or https://ui.perfetto.dev), one process per
+line of runs.txt.  The asyncio parts aren't traced.
 """
+import argparse
+
 from common import *
 from functions import depth_fs_pedigree, breadth_fs_pedigree, breadth_fs_pedigree_limit5
+from crawler import pool_fs_pedigree, streaming_bfs_pedigree, adaptive_bfs_pedigree, POOL_WORKERS, ADAPTIVE_WORKERS
+from async_crawler import async_depth_fs_pedigree, async_breadth_fs_pedigree, async_breadth_fs_pedigree_limit5
 
 from cse351 import *
 
 DFS = 'Depth First Search'
 BFS = 'Breadth First Search'
 BFS5 = 'Breadth First Search limit 5'
+POOL = f'Worker Pool ({POOL_WORKERS} workers)'
+ASYNC_DFS = 'asyncio Depth First Search'
+ASYNC_BFS = 'asyncio Breadth First Search'
+ASYNC_BFS5 = 'asyncio Breadth First Search limit 5'
+STREAM_BFS = f'Streaming Breadth First Search ({POOL_WORKERS} workers)'
+ADAPTIVE_BFS = f'Adaptive Breadth First Search ({ADAPTIVE_WORKERS} workers)'
+
+# keyword arguments for Tree.display(), set from the command line
+DISPLAY = {}
+
+# parts that always talk to the server, they can't run from the cache
+ASYNC_PARTS = (5, 6, 7)
 
 def run_part(log, start_id, generations, title, func):
-    tree = Tree(start_id)
+    # statistics are kept up to date while crawling
+    tree = Tree(start_id, incremental=True)
+    tracer.start_part(f'{title}: {generations} generations')
 
-    get_data_from_server(f'{TOP_API_URL}/start/{generations}')
+    # cache-only never talks to the server, so there is no /start or /end
+    use_server = cache.mode != DiskCache.CACHE_ONLY
+    if use_server:
+        get_data_from_server(f'{TOP_API_URL}/start/{generations}')
+    cache.start(start_id, generations)
 
     log.write('\n')
     log.write('#' * 45)
     log.start_timer(f'{title}: {generations} generations')
     log.write('#' * 45)
+    flight.reset()
+    gate.reset()
     func(start_id, tree)
     total_time = log.stop_timer()
 
-    server_data = get_data_from_server(f'{TOP_API_URL}/end')
+    if use_server:
+        server_data = get_data_from_server(f'{TOP_API_URL}/end')
+        print_dict(server_data)
+    else:
+        server_data = {'people': 0, 'families': 0, 'api': 0, 'threads': 0}
 
-    print_dict(server_data)
-    
-    tree.display(log)
+    tree.display(log, **DISPLAY)
     log.write('')
     log.write(f'total_time                    : {total_time:.5f}')
     log.write(f'Generations                   : {generations}')
@@ -42,16 +92,53 @@ def run_part(log, start_id, generations, title, func):
     log.write(f'Families:   {tree.get_family_count():>10,} | {server_data["families"]:>14,}')
     log.write(f'API Calls            : {server_data["api"]}')
     log.write(f'Max number of threads: {server_data["threads"]}')
+    log.write(f'Duplicate fetches avoided: {flight.duplicates}')
+    if cache.mode != DiskCache.OFF:
+        log.write(f'Cache ({cache.mode})    : {cache.hits} hits, {cache.misses} misses')
+    if tracer.enabled:
+        spans, wait, network, retries = tracer.summary()
+        log.write(f'Traced fetches       : {spans}, average queue wait {wait * 1000:.1f} ms, '
+                  f'average network {network * 1000:.1f} ms, retries {retries}')
+    if gate.calls:
+        log.write(f'Adaptive limit       : final {int(gate.limit)}, highest {max(limit for _, limit in gate.history)}, '
+                  f'max in flight {gate.max_in_flight}')
+        log.write('Limit history (seconds:limit)')
+        for line in gate.history_lines():
+            log.write(f'    {line}')
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Family Search crawler')
+    parser.add_argument('--cache', choices=DiskCache.MODES, default=DiskCache.OFF,
+                        help='keep the people and families in a cache file')
+    parser.add_argument('--cache-file', default='family_cache.db', help='sqlite cache file')
+    parser.add_argument('--invalidate', action='store_true',
+                        help='throw away the cached records of a tree when it is started')
+    parser.add_argument('--summary', action='store_true', help="don't print the families of the tree")
+    parser.add_argument('--display-file', metavar='PATH', help='write the families of the tree to this file')
+    parser.add_argument('--trace', metavar='PATH', help='write a Chrome trace of every fetch to this file')
+    args = parser.parse_args()
+
+    cache.open(args.cache_file, args.cache, args.invalidate)
+    DISPLAY.update(summary_only=args.summary, path=args.display_file)
+
     log = Log(show_terminal=True, filename_log='assignment.log')
 
-    # starting family
-    data = get_data_from_server(f'{TOP_API_URL}')
-    start_id = data['start_family_id']
+    # starting family, cache-only reads the one saved by an earlier run
+    if cache.mode == DiskCache.CACHE_ONLY:
+        start_id = cache.get_meta('start_family_id')
+        if start_id is None:
+            print(f'No starting family id in {args.cache_file}, run with --cache read-through first')
+            return
+    else:
+        data = get_data_from_server(f'{TOP_API_URL}')
+        start_id = data['start_family_id']
+        cache.set_meta('start_family_id', start_id)
     print(f'Starting Family id: {start_id}')
 
+    # on from here, every traced fetch belongs to a part started by run_part()
+    tracer.enabled = args.trace is not None
+
     # load runs.txt
     # part number, number of generations
     with open('runs.txt') as runs:
@@ -60,12 +147,32 @@ def main():
             part_to_run = int(parts[0])
             generations = int(parts[1])
 
+            if cache.mode == DiskCache.CACHE_ONLY and part_to_run in ASYNC_PARTS:
+                log.write(f'Part {part_to_run} skipped: the asyncio parts need the server, not the cache')
+                continue
+
             if part_to_run == 1:
                 run_part(log, start_id, generations, DFS, depth_fs_pedigree)
             elif part_to_run == 2:
                 run_part(log, start_id, generations, BFS, breadth_fs_pedigree)
             elif part_to_run == 3:
                 run_part(log, start_id, generations, BFS5, breadth_fs_pedigree_limit5)
+            elif part_to_run == 4:
+                run_part(log, start_id, generations, POOL, pool_fs_pedigree)
+            elif part_to_run == 5:
+                run_part(log, start_id, generations, ASYNC_DFS, async_depth_fs_pedigree)
+            elif part_to_run == 6:
+                run_part(log, start_id, generations, ASYNC_BFS, async_breadth_fs_pedigree)
+            elif part_to_run == 7:
+                run_part(log, start_id, generations, ASYNC_BFS5, async_breadth_fs_pedigree_limit5)
+            elif part_to_run == 8:
+                run_part(log, start_id, generations, STREAM_BFS, streaming_bfs_pedigree)
+            elif part_to_run == 9:
+                run_part(log, start_id, generations, ADAPTIVE_BFS, adaptive_bfs_pedigree)
+
+    if tracer.enabled:
+        tracer.export(args.trace)
+        print(f'Trace written to {args.trace}')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,181 @@
+using System;
+using System.Collections.Generic;
+using System.Diagnostics;
+using System.Linq;
+using System.Threading.Tasks;
+
+namespace Assignment14;
+
+// Limit on the HTTP calls in flight that finds its own value (AIMD, like TCP).
+//
+// - slow start: every call that comes back in time adds 1, so the limit doubles
+//   each round trip until the first slow call or error
+// - then every call that comes back in time adds 1/limit, about 1 per round trip
+// - a call slower than LatencyFactor times the fastest call seen, or one that
+//   failed, multiplies the limit by Decrease.  Only calls started after the last
+//   cut can cut again, so a burst of slow replies is one cut and not many.
+//
+// Used instead of the fixed SemaphoreSlim when FS_HTTP_GATE=adaptive.
+public sealed class AdaptiveGate
+{
+    private const double MergeSeconds = 0.05;
+
+    private readonly object _lock = new();
+    private readonly Queue<TaskCompletionSource<bool>> _waiters = new();
+    private readonly List<(double Seconds, int Limit)> _history = new();
+    private Stopwatch _clock = Stopwatch.StartNew();
+
+    private double _limit;
+    private int _inFlight;
+    private bool _slowStart;
+    private double _minLatency;
+    private double _lastCut;
+
+    public int Initial { get; }
+    public int Minimum { get; }
+    public int Maximum { get; }
+    public double Decrease { get; }
+    public double LatencyFactor { get; }
+    public int MaxInFlight { get; private set; }
+
+    public AdaptiveGate(int initial = 5, int minimum = 1, int maximum = 512, double decrease = 0.5, double latencyFactor = 2.0)
+    {
+        Initial = initial;
+        Minimum = minimum;
+        Maximum = maximum;
+        Decrease = decrease;
+        LatencyFactor = latencyFactor;
+        Reset();
+    }
+
+    public int Limit
+    {
+        get { lock (_lock) { return (int)_limit; } }
+    }
+
+    public void Reset()
+    {
+        lock (_lock)
+        {
+            _clock = Stopwatch.StartNew();
+            _limit = Initial;
+            _inFlight = 0;
+            _slowStart = true;
+            _minLatency = double.MaxValue;
+            _lastCut = -1;
+            MaxInFlight = 0;
+            _history.Clear();
+            _history.Add((0.0, Initial));
+        }
+    }
+
+    // Waits for a permit, returns the start time to pass to Release()
+    public async Task<double> WaitAsync()
+    {
+        TaskCompletionSource<bool>? waiter = null;
+        lock (_lock)
+        {
+            if (_inFlight < (int)_limit)
+            {
+                TakePermit();
+            }
+            else
+            {
+                waiter = new TaskCompletionSource<bool>(TaskCreationOptions.RunContinuationsAsynchronously);
+                _waiters.Enqueue(waiter);
+            }
+        }
+
+        // Release() takes the permit for us before it wakes the waiter
+        if (waiter != null)
+        {
+            await waiter.Task;
+        }
+        return _clock.Elapsed.TotalSeconds;
+    }
+
+    public void Release(double started, bool ok)
+    {
+        lock (_lock)
+        {
+            var now = _clock.Elapsed.TotalSeconds;
+            var latency = now - started;
+            var oldLimit = (int)_limit;
+            _inFlight--;
+
+            if (ok && latency < _minLatency)
+            {
+                _minLatency = latency;
+            }
+            var slow = !ok || latency > _minLatency * LatencyFactor;
+
+            if (slow)
+            {
+                if (started > _lastCut)
+                {
+                    _limit = Math.Max(Minimum, _limit * Decrease);
+                    _lastCut = now;
+                    _slowStart = false;
+                }
+            }
+            else if (_slowStart)
+            {
+                _limit = Math.Min(Maximum, _limit + 1);
+            }
+            else
+            {
+                _limit = Math.Min(Maximum, _limit + 1 / _limit);
+            }
+
+            if ((int)_limit != oldLimit)
+            {
+                RecordLimit(now, oldLimit);
+            }
+
+            while (_waiters.Count > 0 && _inFlight < (int)_limit)
+            {
+                TakePermit();
+                _waiters.Dequeue().SetResult(true);
+            }
+        }
+    }
+
+    public IEnumerable<string> HistoryLines(int perLine = 8)
+    {
+        List<string> entries;
+        lock (_lock)
+        {
+            entries = _history.Select(entry => $"{entry.Seconds,6:F2}s:{entry.Limit,-4}").ToList();
+        }
+        for (var i = 0; i < entries.Count; i += perLine)
+        {
+            yield return string.Join("  ", entries.Skip(i).Take(perLine));
+        }
+    }
+
+    public int HighestLimit
+    {
+        get { lock (_lock) { return _history.Max(entry => entry.Limit); } }
+    }
+
+    private void TakePermit()
+    {
+        _inFlight++;
+        MaxInFlight = Math.Max(MaxInFlight, _inFlight);
+    }
+
+    private void RecordLimit(double now, int oldLimit)
+    {
+        var limit = (int)_limit;
+        var last = _history[^1];
+        // increases close together are kept as one entry
+        if (_history.Count > 1 && last.Limit < limit && last.Limit == oldLimit && now - last.Seconds < MergeSeconds)
+        {
+            _history[^1] = (now, limit);
+        }
+        else
+        {
+            _history.Add((now, limit));
+        }
+    }
+}
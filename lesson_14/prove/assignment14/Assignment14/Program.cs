@@ -21,6 +21,7 @@ class Program
         Logger.Write(title + ": " + generations + " generations");
         Logger.Write("".PadRight(45, '#'));
         
+        Solve.AdaptiveGate?.Reset();
         var timer = System.Diagnostics.Stopwatch.StartNew();
         var tree = new Tree(startId);
         await func(startId, tree);
@@ -44,6 +45,17 @@ class Program
         Logger.Write($"Families: {tree.FamilyCount,12:N0} | {serverData["families"],14:N0}");
         Logger.Write($"API Calls                   : {serverData["api"]}");
         Logger.Write($"Max number of threads       : {serverData["threads"]}");
+
+        var gate = Solve.AdaptiveGate;
+        if (gate != null)
+        {
+            Logger.Write($"Adaptive limit              : final {gate.Limit}, highest {gate.HighestLimit}, max in flight {gate.MaxInFlight}");
+            Logger.Write("Limit history (seconds:limit)");
+            foreach (var line in gate.HistoryLines())
+            {
+                Logger.Write("    " + line);
+            }
+        }
     }
     
     static async Task Main()
@@ -52,7 +64,9 @@ class Program
         var logPath = Path.GetFullPath(Path.Combine(projectDir, "..", "..", "logs", "assignment.log"));
         Logger.Configure(minimumLevel: LogLevel.Debug, logToFile: true, filePath: logPath);
         Logger.LogToConsole = false;
-        Logger.Write($"HTTP gate size (FS_HTTP_GATE): {Solve.HttpGateSize}");
+        Logger.Write(Solve.AdaptiveGate != null
+            ? "HTTP gate size (FS_HTTP_GATE): adaptive"
+            : $"HTTP gate size (FS_HTTP_GATE): {Solve.HttpGateSize}");
         
         var data = await Solve.GetDataFromServerAsync($"{Solve.TopApiUrl}");
         long start_id = (long)data["start_family_id"];
@@ -14,6 +14,8 @@ public static class Solve
     private static readonly int HttpGateSlots = ResolveHttpGate();
     private static readonly HttpClient HttpClient;
     private static readonly SemaphoreSlim HttpSemaphore = new(HttpGateSlots);
+    // FS_HTTP_GATE=adaptive replaces the fixed semaphore with an AIMD gate
+    private static readonly AdaptiveGate? AdaptiveHttpGate = ResolveAdaptiveGate();
     public const string TopApiUrl = "http://127.0.0.1:8123";
 
     static Solve()
@@ -33,6 +35,13 @@ public static class Solve
     }
 
     public static int HttpGateSize => HttpGateSlots;
+    public static AdaptiveGate? AdaptiveGate => AdaptiveHttpGate;
+
+    private static AdaptiveGate? ResolveAdaptiveGate()
+    {
+        var envValue = Environment.GetEnvironmentVariable("FS_HTTP_GATE");
+        return string.Equals(envValue?.Trim(), "adaptive", StringComparison.OrdinalIgnoreCase) ? new AdaptiveGate() : null;
+    }
 
     private static int ResolveHttpGate()
     {
@@ -48,7 +57,34 @@ public static class Solve
     // This function retrieves JSON from the server
     public static async Task<JObject?> GetDataFromServerAsync(string url)
     {
+        if (AdaptiveHttpGate != null)
+        {
+            var started = await AdaptiveHttpGate.WaitAsync();
+            JObject? result = null;
+            try
+            {
+                result = await FetchJsonAsync(url);
+                return result;
+            }
+            finally
+            {
+                AdaptiveHttpGate.Release(started, result != null);
+            }
+        }
+
         await HttpSemaphore.WaitAsync();
+        try
+        {
+            return await FetchJsonAsync(url);
+        }
+        finally
+        {
+            HttpSemaphore.Release();
+        }
+    }
+
+    private static async Task<JObject?> FetchJsonAsync(string url)
+    {
         try
         {
             var jsonString = await HttpClient.GetStringAsync(url);
@@ -59,11 +95,7 @@ public static class Solve
             Console.WriteLine($"Error fetching data from {url}: {e.Message}");
             return null;
         }
-        finally
-        {
-            HttpSemaphore.Release();
-        }
-    }
+    }
 
     // This function takes in a person ID and retrieves a Person object
     // Hint: It can be used in a "new List<Task<Person?>>()" list
@@ -34,7 +34,12 @@ def load_history():
 def save_history(history):
     HISTORY_FILE.write_text(json.dumps(history, indent=2))
 
-def run_once(gate_override: int | None):
+def gate_arg(value: str):
+    if value == "adaptive":
+        return value
+    return int(value)
+
+def run_once(gate_override: int | str | None):
     env = os.environ.copy()
     env["PATH"] = f"{env['HOME']}/.dotnet:" + env["PATH"]
     if gate_override is not None:
@@ -55,7 +60,7 @@ def main():
     parser.add_argument("--skip-run", action="store_true", help="Only summarize existing history without running new iterations")
     parser.add_argument("--reset-history", action="store_true", help="Clear run_history.json before running")
     parser.add_argument("--milestone", type=int, default=1, help="Milestone number for reporting")
-    parser.add_argument("--gate", type=int, help="Override FS_HTTP_GATE (HTTP semaphore slots) for each run")
+    parser.add_argument("--gate", type=gate_arg, help="Override FS_HTTP_GATE (HTTP semaphore slots, or 'adaptive') for each run")
     args = parser.parse_args()
 
     if args.reset_history:
@@ -68,7 +73,12 @@ def main():
             gate_value = args.gate
         else:
             env_gate = os.environ.get("FS_HTTP_GATE")
-            gate_value = int(env_gate) if env_gate and env_gate.isdigit() else DEFAULT_GATE
+            if env_gate and env_gate.isdigit():
+                gate_value = int(env_gate)
+            elif env_gate and env_gate.strip().lower() == "adaptive":
+                gate_value = "adaptive"
+            else:
+                gate_value = DEFAULT_GATE
         for _ in range(args.iterations):
             run_once(args.gate)
             dfs, bfs = parse_latest(args.log)
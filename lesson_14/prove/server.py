@@ -9,6 +9,26 @@ Instructions:
 
 Open a terminal window and run this program
 
+    python server.py                    (one thread per connection)
+    python server.py --backend async    (single asyncio event loop)
+    python server.py --keep-alive       (HTTP/1.1 persistent connections)
+    python server.py --json-cache       (serialize the tree once at /start)
+    python server.py --compact          (array backed tree for 12-16 generations)
+    python server.py --quiet --async-log (high throughput, no per-request output)
+    python server.py --seed 42 --snapshot tree.snap
+                                        (same tree every run, reloaded with mmap)
+    python server.py --latency lognormal:0.2,0.5 --spike-rate 0.01 --spike 2
+                                        (simulated latency model, see LatencyModel)
+
+The latency model can also be picked per run in the start URL:
+    /start/6?latency=uniform:0.1,0.4&family=constant:0.5&spike_rate=0.01&spike=2
+
+A busy server can be simulated with a limiter on the person / family calls:
+    python server.py --max-in-flight 20 --rate 100 --burst 20 --reject-status 503
+
+/stats returns per-endpoint counts and latency histograms while a client runs.
+It isn't counted as an API call and doesn't reset anything.
+
 *******************  DO NOT MODIFY!!!!  *********************
 *******************  DO NOT MODIFY!!!!  *********************
 *******************  DO NOT MODIFY!!!!  *********************
@@ -19,14 +39,25 @@ Open a terminal window and run this program
 
 """
 
+from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from socketserver import ThreadingMixIn
+from email.utils import formatdate
+import argparse
+import asyncio
 import datetime
 import json
 import time
 import random
 import threading
-import ast
+import queue
+import sys
+import os
+import math
+import mmap
+import struct
+from array import array
+from urllib.parse import urlsplit, parse_qs
 
 hostName = "127.0.0.1"
 serverPort = 8123
@@ -34,6 +65,9 @@ serverPort = 8123
 SLEEP = 0.25
 MAX_GENERATIONS = 6
 
+# seconds an idle keep-alive connection is held open
+KEEP_ALIVE_TIMEOUT = 30
+
 primes = (5000007787, 5000007797, 5000007799, 5000007811, 5000007823, 5000007829, 5000007877, 5000007899,
             5000007911, 5000007919, 5000007953, 5000007977, 5000007983, 5000008007, 5000008037, 5000008043, 5000008109, 5000008121,
             5000008127, 5000008133, 5000008147, 5000008151, 5000008201, 5000008219, 5000008271, 5000008297, 5000008313, 5000008319,
@@ -71,16 +105,31 @@ surnames = ('Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Miller', 'Davis',
             'Pérez', 'Sánchez', 'Ramírez', 'Flores', 'Gómez', 'Torres', 'Díaz', 'Vásquez', 
             'Cruz', 'Morales', 'Gutiérrez', 'Reyes', 'Ruíz', 'Jiménez')
 
-max_thread_count = 0
-call_count = 0
-thread_count = 0
-lock = threading.Lock()
-
 family_request_order = []
 people = {}
 families = {}
 generations_created = 0
 
+# Pre-serialized replies, key = person / family id, value = JSON bytes
+json_cache_enabled = False
+person_json = {}
+family_json = {}
+json_cache_bytes = 0
+
+# --quiet: no per-request console or log output
+quiet = False
+
+# Build the tree into columnar arrays (CompactTree) instead of objects
+compact_tree_enabled = False
+
+# --seed: every /start builds the same tree for the same generations
+tree_seed = None
+
+# --snapshot: file the compact tree is saved to / loaded from, and the
+# (generations, CompactTree) that /start can reuse without building
+snapshot_path = None
+snapshot = None
+
 
 def get_name_male():
     return random.choice(male_names)
@@ -92,15 +141,19 @@ def get_name_female():
 def get_surname():
     return random.choice(surnames)
 
-def get_date():
-    start_date = datetime.date(1753, 1, 1)
-    end_date = datetime.date(2020, 1, 1)
+BIRTH_START = datetime.date(1753, 1, 1)
+BIRTH_END = datetime.date(2020, 1, 1)
+
+def get_birth_days():
+    # random birth date as the number of days after BIRTH_START
+    return random.randrange((BIRTH_END - BIRTH_START).days)
 
-    time_between_dates = end_date - start_date
-    days_between_dates = time_between_dates.days
-    random_number_of_days = random.randrange(days_between_dates)
-    random_date = start_date + datetime.timedelta(days=random_number_of_days)
-    return f'{random_date.day}-{random_date.month}-{random_date.year}'
+def format_birth(days):
+    birth_date = BIRTH_START + datetime.timedelta(days=days)
+    return f'{birth_date.day}-{birth_date.month}-{birth_date.year}'
+
+def get_date():
+    return format_birth(get_birth_days())
 
 def encode(id: int):
     if id == None:
@@ -121,19 +174,450 @@ class Log:
         self.lock = threading.Lock()
         self.filename = filename
         self.file = open(filename, 'w')
+        self.queue = None
+
+    def start_writer(self, batch_size=1000):
+        """
+        Hand lines to a background thread instead of writing them in the
+        request thread.  The writer flushes once per batch, not once per line.
+        """
+        self.batch_size = batch_size
+        self.queue = queue.SimpleQueue()
+        threading.Thread(target=self._writer, name='log-writer', daemon=True).start()
+
+    def _writer(self):
+        while True:
+            items = [self.queue.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = [item for item in items if isinstance(item, str)]
+            with self.lock:
+                if lines:
+                    self.file.write('\n'.join(lines))
+                    self.file.write('\n')
+                self.file.flush()
+
+            # flush() requests
+            for item in items:
+                if isinstance(item, threading.Event):
+                    item.set()
 
     def write(self, line):
+        if self.queue != None:
+            self.queue.put(line)
+            return
+
         with self.lock:
             self.file.write(line)
             self.file.write('\n')
             self.file.flush()
 
+    def flush(self):
+        """ Wait until the background writer has written everything queued so far """
+        if self.queue != None:
+            done = threading.Event()
+            self.queue.put(done)
+            done.wait()
+
     def __del__(self):
         self.file.close()
 
 # Global log object
 log = Log('server.log')
 
+
+# ----------------------------------------------------------------------------
+class RequestCounters:
+    """
+    Request accounting without a shared lock.  Each thread only updates its
+    own cell [calls, max active, batch items, rejected] and the cells are merged when
+    the totals are needed (/end).  In-flight requests are tracked with list
+    append() / pop(), which are atomic in CPython.
+    """
+
+    def __init__(self):
+        self.cells = {}
+        self.active = []
+
+    def _cell(self):
+        cell = self.cells.get(threading.get_ident())
+        if cell == None:
+            cell = self.cells.setdefault(threading.get_ident(), [0, 0, 0, 0])
+        return cell
+
+    def enter(self):
+        self.active.append(None)
+        active = len(self.active)
+        cell = self._cell()
+        cell[0] += 1
+        if active > cell[1]:
+            cell[1] = active
+        return active
+
+    def leave(self):
+        self.active.pop()
+
+    def add_batch_items(self, count):
+        self._cell()[2] += count
+
+    def add_rejected(self):
+        self._cell()[3] += 1
+
+    def reset(self):
+        # /start counts as the first call of the new run
+        self.cells = {threading.get_ident(): [1, 1, 0, 0]}
+
+    def totals(self):
+        """ Returns (calls, max active, batch items, rejected) """
+        cells = list(self.cells.values())
+        calls = sum(cell[0] for cell in cells)
+        max_active = max((cell[1] for cell in cells), default=0)
+        batch_items = sum(cell[2] for cell in cells)
+        rejected = sum(cell[3] for cell in cells)
+        return calls, max_active, batch_items, rejected
+
+# Global request counters
+counters = RequestCounters()
+
+
+# ----------------------------------------------------------------------------
+class LatencyHistogram:
+    """
+    HDR style histogram of durations, recorded in microseconds.  Each power
+    of two range is split into 16 linear sub-buckets, so a reported value is
+    within about 6% of the recorded one whatever its size.
+    """
+
+    SUB_BUCKETS = 16
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @classmethod
+    def index(cls, value):
+        if value < 2 * cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - 5
+        return (shift + 1) * cls.SUB_BUCKETS + (value >> shift) - cls.SUB_BUCKETS
+
+    @classmethod
+    def highest_value(cls, index):
+        if index < 2 * cls.SUB_BUCKETS:
+            return index
+        shift = index // cls.SUB_BUCKETS - 1
+        return ((index % cls.SUB_BUCKETS + cls.SUB_BUCKETS + 1) << shift) - 1
+
+    def record(self, seconds):
+        value = max(0, int(seconds * 1_000_000))
+        index = self.index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """ Add the values recorded by other """
+        for index, count in list(other.counts.items()):
+            self.counts[index] = self.counts.get(index, 0) + count
+            self.count += count
+        self.total += other.total
+        if other.max > self.max:
+            self.max = other.max
+
+    def percentile(self, percent):
+        if self.count == 0:
+            return 0
+        wanted = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= wanted:
+                return min(self.highest_value(index), self.max)
+        return self.max
+
+    def summary(self):
+        """ Milliseconds """
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count / 1000, 3) if self.count else 0,
+            'p50': self.percentile(50) / 1000,
+            'p90': self.percentile(90) / 1000,
+            'p99': self.percentile(99) / 1000,
+            'p999': self.percentile(99.9) / 1000,
+            'max': self.max / 1000,
+        }
+
+
+class MetricsRegistry:
+    """
+    Per-endpoint request counts, status codes and latency histograms split
+    into queueing time (accepted -> handler starts) and service time
+    (handler starts -> reply written), plus the highest number of requests in
+    flight for each second of the run.  snapshot() doesn't reset anything, so
+    /stats can be polled while a client is running.
+
+    Like RequestCounters there is no shared lock: each thread records into
+    its own cell (endpoints, concurrency) and snapshot() merges the cells.
+    """
+
+    MAX_SECONDS = 3600
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.monotonic()
+        self.cells = {}
+
+    def _cell(self):
+        cell = self.cells.get(threading.get_ident())
+        if cell == None:
+            cell = self.cells.setdefault(threading.get_ident(), ({}, {}))
+        return cell
+
+    @staticmethod
+    def _new_stats():
+        return {'count': 0, 'status': {}, 'queue': LatencyHistogram(), 'service': LatencyHistogram()}
+
+    def record(self, endpoint, status, queued, service):
+        endpoints = self._cell()[0]
+        stats = endpoints.get(endpoint)
+        if stats == None:
+            stats = endpoints[endpoint] = self._new_stats()
+        stats['count'] += 1
+        stats['status'][status] = stats['status'].get(status, 0) + 1
+        stats['queue'].record(queued)
+        stats['service'].record(service)
+
+    def sample_concurrency(self, in_flight):
+        second = int(time.monotonic() - self.started)
+        concurrency = self._cell()[1]
+        if in_flight > concurrency.get(second, 0):
+            concurrency[second] = in_flight
+            if len(concurrency) > self.MAX_SECONDS:
+                del concurrency[min(concurrency)]
+
+    def snapshot(self):
+        # list() copies are taken in one step, the threads keep recording
+        endpoints = {}
+        concurrency = {}
+        for cell_endpoints, cell_concurrency in list(self.cells.values()):
+            for name, stats in list(cell_endpoints.items()):
+                merged = endpoints.get(name)
+                if merged == None:
+                    merged = endpoints[name] = self._new_stats()
+                merged['count'] += stats['count']
+                for code, count in list(stats['status'].items()):
+                    merged['status'][code] = merged['status'].get(code, 0) + count
+                merged['queue'].merge(stats['queue'])
+                merged['service'].merge(stats['service'])
+            for second, in_flight in list(cell_concurrency.items()):
+                if in_flight > concurrency.get(second, 0):
+                    concurrency[second] = in_flight
+
+        return {
+            'uptime': round(time.monotonic() - self.started, 3),
+            'endpoints': {
+                name: {
+                    'count': stats['count'],
+                    'status': {str(code): count for code, count in stats['status'].items()},
+                    'queue_ms': stats['queue'].summary(),
+                    'service_ms': stats['service'].summary(),
+                } for name, stats in endpoints.items()
+            },
+            'concurrency': sorted(concurrency.items())[-self.MAX_SECONDS:],
+        }
+
+# Global metrics, reset by /start and read by /stats
+metrics = MetricsRegistry()
+
+
+# ----------------------------------------------------------------------------
+ENDPOINTS = ('start', 'end', 'person', 'family', 'people', 'families', 'root')
+
+def endpoint_of(path):
+    """ Endpoint name for a request path, used for latency and statistics """
+    path = urlsplit(path).path
+    if path == '/stats':
+        return 'stats'
+    if path.startswith('/people'):
+        return 'people'
+    if path.startswith('/families'):
+        return 'families'
+    for name in ('start', 'end', 'person', 'family'):
+        if name in path:
+            return name
+    return 'root'
+
+
+class LatencyModel:
+    """
+    Simulated service time of a request.  A profile is written as
+
+        constant:SECONDS
+        uniform:LOW,HIGH
+        lognormal:MEDIAN,SIGMA
+
+    Endpoints can have their own profile (endpoints = {'family': 'uniform:0.1,0.5'})
+    and spike_rate is the chance a request gets spike extra seconds on top,
+    e.g. spike_rate=0.01 puts a long tail past the 99th percentile.
+    """
+
+    KINDS = {'constant': 1, 'uniform': 2, 'lognormal': 2}
+
+    def __init__(self, profile=f'constant:{SLEEP}', endpoints=None, spike_rate=0.0, spike=0.0, seed=None):
+        self.profile = self.parse(profile)
+        self.endpoints = {name: self.parse(spec) for name, spec in (endpoints or {}).items()}
+        for name in self.endpoints:
+            if name not in ENDPOINTS:
+                raise ValueError(f'unknown endpoint {name}, use one of {", ".join(ENDPOINTS)}')
+        self.spike_rate = float(spike_rate)
+        self.spike = float(spike)
+        self.rng = random.Random(seed)
+
+    @classmethod
+    def parse(cls, spec):
+        kind, _, values = spec.partition(':')
+        try:
+            params = tuple(float(value) for value in values.split(',') if value != '')
+        except ValueError:
+            raise ValueError(f'bad latency profile {spec}')
+        if kind not in cls.KINDS or len(params) != cls.KINDS[kind]:
+            raise ValueError(f'bad latency profile {spec}, use constant:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA')
+        return kind, params
+
+    def _draw(self, profile):
+        kind, params = profile
+        if kind == 'constant':
+            return params[0]
+        if kind == 'uniform':
+            return self.rng.uniform(*params)
+        median, sigma = params
+        if median <= 0:
+            return 0.0
+        return self.rng.lognormvariate(math.log(median), sigma)
+
+    def sample(self, endpoint):
+        delay = self._draw(self.endpoints.get(endpoint, self.profile))
+        if self.spike_rate > 0 and self.rng.random() < self.spike_rate:
+            delay += self.spike
+        return delay
+
+    @staticmethod
+    def format(profile):
+        kind, params = profile
+        return kind + ':' + ','.join(f'{value:g}' for value in params)
+
+    def describe(self):
+        return {
+            'profile': self.format(self.profile),
+            'endpoints': {name: self.format(profile) for name, profile in self.endpoints.items()},
+            'spike_rate': self.spike_rate,
+            'spike': self.spike,
+        }
+
+    @classmethod
+    def from_query(cls, query, current):
+        """
+        Model for the /start query string (parse_qs output), keeping the
+        current model's settings for anything not given.  None if the query
+        has no latency settings.
+        """
+        keys = {'latency', 'spike_rate', 'spike'} | set(ENDPOINTS)
+        if not keys & set(query):
+            return None
+
+        described = current.describe()
+        endpoints = dict(described['endpoints'])
+        for name in ENDPOINTS:
+            if name in query:
+                endpoints[name] = query[name][0]
+        return cls(query.get('latency', [described['profile']])[0],
+                   endpoints,
+                   query.get('spike_rate', [described['spike_rate']])[0],
+                   query.get('spike', [described['spike']])[0],
+                   current.rng.random())
+
+# Global latency model, SLEEP seconds for every request unless changed
+latency_model = LatencyModel()
+
+
+# ----------------------------------------------------------------------------
+class RequestLimiter:
+    """
+    Optional admission control for the person / family endpoints: at most
+    max_in_flight of them at once and a token bucket refilled at rate tokens
+    per second holding up to burst tokens.  A request that doesn't get in is
+    answered right away with status (429 or 503) and a Retry-After header.
+    0 turns a limit off.
+    """
+
+    LIMITED = ('person', 'family', 'people', 'families')
+
+    def __init__(self, max_in_flight=0, rate=0.0, burst=0, status=429):
+        self.lock = threading.Lock()
+        self.max_in_flight = max_in_flight
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.status = status
+        self.in_flight = 0
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def enabled(self):
+        return self.max_in_flight > 0 or self.rate > 0
+
+    def admit(self, endpoint):
+        """ Returns None if the request can go ahead, else the Retry-After seconds """
+        if endpoint not in self.LIMITED or not self.enabled():
+            return None
+
+        with self.lock:
+            if self.max_in_flight > 0 and self.in_flight >= self.max_in_flight:
+                return 1
+
+            if self.rate > 0:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens < 1:
+                    return max(1, math.ceil((1 - self.tokens) / self.rate))
+                self.tokens -= 1
+
+            self.in_flight += 1
+            return None
+
+    def release(self, endpoint):
+        if endpoint not in self.LIMITED or not self.enabled():
+            return
+        with self.lock:
+            self.in_flight -= 1
+
+    def describe(self):
+        return {
+            'max_in_flight': self.max_in_flight,
+            'rate': self.rate,
+            'burst': self.burst,
+            'status': self.status,
+        }
+
+# Global request limiter, off unless --max-in-flight or --rate is given
+limiter = RequestLimiter()
+
+
+def busy_reply(retry_after):
+    counters.add_rejected()
+    json_data = json.dumps({"status": "busy", "retry_after": retry_after})
+    return limiter.status, json_data, {"Retry-After": str(retry_after)}
+
 # ----------------------------------------------------------------------------
 class Person:
     
@@ -278,172 +762,780 @@ def build_tree(gens):
     log.write(f'Number of people  : {len(people)}')
     log.write(f'Number of families: {len(families)}')
 
-    
+
 # ----------------------------------------------------------------------------
-class Handler(BaseHTTPRequestHandler):
+# Compact tree
+#
+# Every person and family column is an array indexed by id (index 0 is
+# unused, 0 also stands for "no id").  A family's own children are always
+# created together, so they are stored as the first child id plus a count.
+# The one child added later (the husband or wife of the family below it) is
+# kept in family_heir.  PersonView / FamilyView give the same get_dict() and
+# __str__() as Person and Family, so the Handler doesn't know the difference.
+
+all_names = male_names + female_names
+name_index = {name: index for index, name in enumerate(all_names)}
+
+
+class CompactTree:
+
+    __slots__ = ('person_name', 'person_birth', 'person_parents', 'person_family',
+                 'family_husband', 'family_wife', 'family_first_child', 'family_child_count', 'family_heir')
+
+    def __init__(self):
+        self.person_name = array('B', [0])
+        self.person_birth = array('i', [0])
+        self.person_parents = array('i', [0])
+        self.person_family = array('i', [0])
+
+        self.family_husband = array('i', [0])
+        self.family_wife = array('i', [0])
+        self.family_first_child = array('i', [0])
+        self.family_child_count = array('B', [0])
+        self.family_heir = array('i', [0])
+
+    def add_person(self, name, family=0):
+        self.person_name.append(name_index[name])
+        self.person_birth.append(get_birth_days())
+        self.person_parents.append(0)
+        self.person_family.append(family)
+
+    def add_family(self, husband, wife, first_child, child_count):
+        self.family_husband.append(husband)
+        self.family_wife.append(wife)
+        self.family_first_child.append(first_child)
+        self.family_child_count.append(child_count)
+        self.family_heir.append(0)
+
+    @classmethod
+    def from_columns(cls, columns):
+        tree = cls.__new__(cls)
+        for name, column in zip(cls.__slots__, columns):
+            setattr(tree, name, column)
+        return tree
+
+    def columns(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+    def nbytes(self):
+        columns = (getattr(self, name) for name in self.__slots__)
+        return sum(column.itemsize * len(column) for column in columns)
+
+
+class PersonView:
+
+    __slots__ = ('tree', 'id')
+
+    def __init__(self, tree, id):
+        self.tree = tree
+        self.id = id
 
-    def get_person(self, id):
-        global people
-        if id in people:
-            return people[id].get_dict()
-        else:
-            return None
+    @property
+    def name(self):
+        return all_names[self.tree.person_name[self.id]]
+
+    @property
+    def birth(self):
+        return format_birth(self.tree.person_birth[self.id])
+
+    @property
+    def parents(self):
+        return self.tree.person_parents[self.id] or None
+
+    @property
+    def family(self):
+        return self.tree.person_family[self.id] or None
+
+    def get_dict(self):
+        person_dict = {}
+
+        person_dict["id"] = encode(self.id)
+        person_dict["name"] = self.name
+        person_dict["birth"] = self.birth
+        person_dict["parent_id"] = encode(self.parents)
+        person_dict["family_id"] = encode(self.family)
 
+        return person_dict
+
+    def __str__(self):
+        output  = f'id        : {encode(self.id)}\n'
+        output += f'name       : {self.name}\n'
+        output += f'birth      : {self.birth}\n'
+        output += f'parent id : {encode(self.parents)}\n'
+        output += f'family id : {encode(self.family)}\n'
+
+        return output
+
+
+class FamilyView:
+
+    __slots__ = ('tree', 'id')
+
+    def __init__(self, tree, id):
+        self.tree = tree
+        self.id = id
+
+    @property
+    def husband(self):
+        return self.tree.family_husband[self.id]
+
+    @property
+    def wife(self):
+        return self.tree.family_wife[self.id]
+
+    @property
+    def children(self):
+        first = self.tree.family_first_child[self.id]
+        ids = list(range(first, first + self.tree.family_child_count[self.id]))
+        if self.tree.family_heir[self.id]:
+            ids.append(self.tree.family_heir[self.id])
+        return ids
+
+    def get_dict(self):
+        family_dict = {}
+
+        family_dict["id"] = encode(self.id)
+        family_dict["husband_id"] = encode(self.husband)
+        family_dict["wife_id"] = encode(self.wife)
+        family_dict["children"] = [encode(child) for child in self.children]
+
+        return family_dict
+
+    def __str__(self):
+        output  = f'id         : {encode(self.id)}\n'
+        output += f'husband    : {encode(self.husband)}\n'
+        output += f'wife       : {encode(self.wife)}\n'
+        for child in self.children:
+            output += f'  Child    : {encode(child)}\n'
+
+        return output
+
+
+class CompactTable:
+    """ Read only dict look-alike: id -> PersonView / FamilyView """
+
+    __slots__ = ('tree', 'view', 'column')
+
+    def __init__(self, tree, view, column):
+        self.tree = tree
+        self.view = view
+        self.column = column
+
+    def __len__(self):
+        return len(self.column) - 1
+
+    def __contains__(self, id):
+        return isinstance(id, int) and 0 < id < len(self.column)
+
+    def __getitem__(self, id):
+        if id not in self:
+            raise KeyError(id)
+        return self.view(self.tree, id)
+
+    def __iter__(self):
+        return iter(range(1, len(self.column)))
+
+    def items(self):
+        for id in self:
+            yield id, self.view(self.tree, id)
+
+    def values(self):
+        for id in self:
+            yield self.view(self.tree, id)
 
-    def get_family(self, id):
-        global families
-        if id in families:
-            return families[id].get_dict()
+
+def build_tree_compact(gens):
+    """
+    Same tree as build_tree() (ids and random calls happen in the same order,
+    so a seeded run gives an identical tree) but built with an explicit stack
+    into a CompactTree, so there is no recursion limit and no object per node.
+    """
+    global people
+    global families
+
+    tree = CompactTree()
+
+    next_person_id = 1
+    next_family_id = 1
+
+    # (generation, id of the person this family are the parents of)
+    stack = [(gens, 0)] if gens >= 1 else []
+    while stack:
+        generation, heir = stack.pop()
+
+        husband = next_person_id
+        wife = next_person_id + 1
+        family = next_family_id
+        tree.add_person(get_name_male(), family)
+        tree.add_person(get_name_female(), family)
+        next_person_id += 2
+        next_family_id += 1
+
+        number_children = random.randint(2, 8)
+        tree.add_family(husband, wife, next_person_id, number_children)
+        for i in range(number_children):
+            if random.randint(1, 2) == 1:
+                tree.add_person(get_name_male())
+            else:
+                tree.add_person(get_name_female())
+            next_person_id += 1
+
+        if heir:
+            tree.person_parents[heir] = family
+            tree.family_heir[family] = heir
+
+        if generation > 1:
+            # wife pushed first so the husband's line is built first
+            stack.append((generation - 1, wife))
+            stack.append((generation - 1, husband))
+
+    use_compact_tree(tree)
+    return tree
+
+
+def use_compact_tree(tree):
+    global people
+    global families
+
+    people = CompactTable(tree, PersonView, tree.person_name)
+    families = CompactTable(tree, FamilyView, tree.family_husband)
+
+    print(f'Number of people  : {len(people)}')
+    print(f'Number of families: {len(families)}')
+    print(f'Tree arrays       : {tree.nbytes():,} bytes')
+    log.write(f'Number of people  : {len(people)}')
+    log.write(f'Number of families: {len(families)}')
+    log.write(f'Tree arrays       : {tree.nbytes():,} bytes')
+
+
+# ----------------------------------------------------------------------------
+# Snapshot file: a header followed by the CompactTree columns, each padded to
+# 8 bytes.  Loading maps the file and the columns are memoryviews over the
+# map, so nothing is parsed or copied.
+SNAPSHOT_MAGIC = b'FSTREE01'
+SNAPSHOT_HEADER = struct.Struct('<8sIqqII')   # magic, gens, PRIME, ID, people, families
+
+def _column_lengths(number_people, number_families):
+    # index 0 is unused in every column
+    return [number_people + 1] * 4 + [number_families + 1] * 5
+
+
+def save_snapshot(path, gens, tree):
+    number_people = len(tree.person_name) - 1
+    number_families = len(tree.family_husband) - 1
+    with open(path, 'wb') as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, gens, PRIME, ID, number_people, number_families))
+        for column in tree.columns():
+            f.write(b'\0' * (-f.tell() % 8))
+            f.write(column.tobytes())
+
+    print(f'Snapshot saved    : {path} ({os.path.getsize(path):,} bytes)')
+    log.write(f'Snapshot saved    : {path} ({os.path.getsize(path):,} bytes)')
+
+
+def load_snapshot(path):
+    """ Returns (gens, PRIME, ID, CompactTree) """
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, gens, prime, id, number_people, number_families = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f'{path} is not a Family Search snapshot')
+
+    view = memoryview(data)
+    template = CompactTree()
+    columns = []
+    offset = SNAPSHOT_HEADER.size
+    for name, length in zip(CompactTree.__slots__, _column_lengths(number_people, number_families)):
+        typecode = getattr(template, name).typecode
+        offset += -offset % 8
+        size = struct.calcsize(typecode) * length
+        columns.append(view[offset:offset + size].cast(typecode))
+        offset += size
+
+    return gens, prime, id, CompactTree.from_columns(columns)
+
+
+def get_peak_rss():
+    """ Peak resident set size in MB, None where resource isn't available (Windows) """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def create_tree(gens):
+    global snapshot
+
+    build_start = time.perf_counter()
+    if snapshot != None and snapshot[0] == gens:
+        print('Using the snapshot tree, build_tree() skipped')
+        log.write('Using the snapshot tree, build_tree() skipped')
+        use_compact_tree(snapshot[1])
+    else:
+        if tree_seed != None:
+            random.seed(f'{tree_seed}:{gens}')
+
+        if compact_tree_enabled or snapshot_path != None:
+            tree = build_tree_compact(gens)
         else:
-            return None
- 
-    def do_GET(self):
-        global thread_count
-        global lock
-        global max_thread_count
-        global call_count
-        global family_request_order
-        global log
-        global generations_created
-
-        with lock:
-            thread_count += 1
-            call_count += 1
-            if thread_count > max_thread_count:
-                max_thread_count = thread_count
-            print(f'Current: active threads / max count: {thread_count} / {max_thread_count}')
-            log.write(f'Current: active threads / max count: {thread_count} / {max_thread_count}')
+            build_tree(gens)
+
+        if snapshot_path != None and snapshot == None:
+            save_snapshot(snapshot_path, gens, tree)
+            snapshot = (gens, tree)
+    build_time = time.perf_counter() - build_start
+
+    rss = get_peak_rss()
+    output = f'Tree build time   : {build_time:.3f} sec, peak RSS: ' + ('n/a' if rss == None else f'{rss:.1f} MB')
+    print(output)
+    log.write(output)
+
+    if json_cache_enabled:
+        build_json_cache()
+
+
+def build_json_cache():
+    """
+    The tree doesn't change after build_tree(), so every person and family
+    is serialized once here and requests only do a dict lookup.
+    """
+    global person_json
+    global family_json
+    global json_cache_bytes
+
+    person_json = {id: bytes(json.dumps(person.get_dict()), 'utf8') for id, person in people.items()}
+    family_json = {id: bytes(json.dumps(family.get_dict()), 'utf8') for id, family in families.items()}
+
+    json_cache_bytes = sys.getsizeof(person_json) + sys.getsizeof(family_json)
+    json_cache_bytes += sum(sys.getsizeof(data) for data in person_json.values())
+    json_cache_bytes += sum(sys.getsizeof(data) for data in family_json.values())
+
+    print(f'JSON cache size   : {json_cache_bytes:,} bytes')
+    log.write(f'JSON cache size   : {json_cache_bytes:,} bytes')
+
+    
+# ----------------------------------------------------------------------------
+def get_person(id):
+    global people
+    if id in people:
+        return people[id].get_dict()
+    else:
+        return None
+
+
+def get_family(id):
+    global families
+    if id in families:
+        return families[id].get_dict()
+    else:
+        return None
+
+
+def get_person_json(id):
+    if json_cache_enabled:
+        return person_json.get(id)
+    data = get_person(id)
+    return None if data == None else json.dumps(data)
+
+
+def get_family_json(id):
+    if json_cache_enabled:
+        return family_json.get(id)
+    data = get_family(id)
+    return None if data == None else json.dumps(data)
+
+
+def stats_json():
+    call_count, max_thread_count, batch_item_count, rejected_count = counters.totals()
+    data = metrics.snapshot()
+    data.update({
+        "in_flight": len(counters.active),
+        "api": call_count,
+        "threads": max_thread_count,
+        "batch_items": batch_item_count,
+        "rejected": rejected_count,
+    })
+    return json.dumps(data)
+
+
+def to_bytes(json_data):
+    if json_data == None:
+        return b''
+    if isinstance(json_data, bytes):
+        return json_data
+    return bytes(json_data, 'utf8')
+
+
+def begin_request(path):
+    thread_count = counters.enter()
+    metrics.sample_concurrency(thread_count)
+
+    if not quiet:
+        _, max_thread_count, _, _ = counters.totals()
+        print(f'Current: active threads / max count: {thread_count} / {max_thread_count}')
+        log.write(f'Current: active threads / max count: {thread_count} / {max_thread_count}')
 
         print('- ' * 35)
-        print(f'Request: {self.path}')
-
-        log.write(f'Request: {self.path}')
-
-        if SLEEP > 0:
-            time.sleep(SLEEP)
-
-        if 'start' in self.path:
-            family_request_order = []
-            parts = self.path.split('/')
-            if len(parts) < 3:
-                self.send_response(404)
-                self.send_header("Content-type",  "application/json")
-                self.end_headers()
-                with lock:
-                    thread_count -= 1
-                return
+        print(f'Request: {path}')
+
+        log.write(f'Request: {path}')
+
+
+def end_request():
+    counters.leave()
 
-            try:
-                generations = int(parts[-1])
-            except:
-                generations = MAX_GENERATIONS
 
-            output = f'Creating family tree with {generations} generations...'
+def process_path(path):
+    """
+    Build the reply for a request path.  Both server backends call this after
+    the simulated latency.  Returns (status, json_data), json_data may be None.
+    """
+    global family_request_order
+    global log
+    global generations_created
+    global latency_model
+
+    if 'start' in path:
+        url = urlsplit(path)
+        parts = url.path.split('/')
+        if len(parts) < 3:
+            return 404, None
+
+        try:
+            model = LatencyModel.from_query(parse_qs(url.query), latency_model)
+        except ValueError as error:
+            print(error)
+            log.write(str(error))
+            return 400, None
+
+        if model != None:
+            latency_model = model
+            output = f'Latency model: {latency_model.describe()}'
             print(output)
             log.write(output)
 
-            generations_created = generations
-            build_tree(generations)
+        try:
+            generations = int(parts[-1])
+        except:
+            generations = MAX_GENERATIONS
 
-            max_thread_count = 1
-            thread_count = 1
-            call_count = 1
+        family_request_order = []
 
-            json_data = '{"status":"OK"}'
+        output = f'Creating family tree with {generations} generations...'
+        print(output)
+        log.write(output)
 
-                    
-        elif 'end' in self.path:
-            print('#' * 80)
-            log.write('#' * 80)
+        generations_created = generations
+        create_tree(generations)
 
-            print(f'Total number of people  : {len(people)}')
-            print(f'Total number of families: {len(families)}')
-            print(f'Number of generations   : {generations_created}')
-            log.write(f'Total number of people  : {len(people)}')
-            log.write(f'Total number of families: {len(families)}')
-            log.write(f'Number of generations   : {generations_created}')
+        counters.reset()
+        metrics.reset()
 
+        json_data = '{"status":"OK"}'
 
-            print('Families were requested in this order:')
-            log.write('Families were requested in this order:')
-            
-            output = str(family_request_order)[1:-1]
-            print(output)
-            log.write(output)
+    elif 'end' in path:
+        call_count, max_thread_count, batch_item_count, rejected_count = counters.totals()
+
+        print('#' * 80)
+        log.write('#' * 80)
+
+        print(f'Total number of people  : {len(people)}')
+        print(f'Total number of families: {len(families)}')
+        print(f'Number of generations   : {generations_created}')
+        log.write(f'Total number of people  : {len(people)}')
+        log.write(f'Total number of families: {len(families)}')
+        log.write(f'Number of generations   : {generations_created}')
+
+
+        print('Families were requested in this order:')
+        log.write('Families were requested in this order:')
+
+        output = str(family_request_order)[1:-1]
+        print(output)
+        log.write(output)
+
+        print(f'Total number of API calls: {call_count}')
+        log.write(f'Total number of API calls: {call_count}')
+
+        print(f'Items returned by batch calls: {batch_item_count}')
+        log.write(f'Items returned by batch calls: {batch_item_count}')
+
+        if limiter.enabled():
+            print(f'Requests rejected as busy    : {rejected_count}')
+            log.write(f'Requests rejected as busy    : {rejected_count}')
+
+        print(f'Final thread count (max count): {max_thread_count}')
+        log.write(f'Final thread count (max count): {max_thread_count}')
+
+        if json_cache_enabled:
+            print(f'JSON cache size (bytes): {json_cache_bytes}')
+            log.write(f'JSON cache size (bytes): {json_cache_bytes}')
+
+        print(f'Latency model: {latency_model.describe()}')
+        log.write(f'Latency model: {latency_model.describe()}')
+
+        data = {
+            "status": "OK",
+            "people": len(people),
+            "families": len(families),
+            "api": call_count,
+            "threads": max_thread_count,
+            "batch_items": batch_item_count,
+            "json_cache_bytes": json_cache_bytes if json_cache_enabled else 0,
+            "latency": latency_model.describe(),
+            "rejected": rejected_count,
+            "limiter": limiter.describe() if limiter.enabled() else None,
+        }
+        json_data = json.dumps(data)
 
-            print(f'Total number of API calls: {call_count}')
-            log.write(f'Total number of API calls: {call_count}')
+        print('#' * 80)
+        log.write('#' * 80)
+        log.flush()
 
-            print(f'Final thread count (max count): {max_thread_count}')
-            log.write(f'Final thread count (max count): {max_thread_count}')
+    # Batch lookups: /people?ids=a,b,c and /families?ids=a,b,c
+    # One API call (and one simulated latency) returns a JSON array with an
+    # entry, or null, for each requested id in the order given.
+    elif path.startswith('/people') or path.startswith('/families'):
+        url = urlsplit(path)
+        query = parse_qs(url.query)
+        if url.path not in ('/people', '/families') or 'ids' not in query:
+            return 404, None
 
-            data_str = '{' + \
-                       f'"status":"OK", "people": {len(people)}, "families": {len(families)}, "api": {call_count}, "threads": {max_thread_count}' + \
-                       '}'
-            json_data = json.dumps(ast.literal_eval(data_str))
+        try:
+            ids = [decode(int(code)) for code in query['ids'][0].split(',') if code != '']
+        except:
+            return 404, None
 
-            print('#' * 80)
-            log.write('#' * 80)
+        if url.path == '/people':
+            items = [get_person_json(id) for id in ids]
+        else:
+            items = [get_family_json(id) for id in ids]
+            family_request_order.extend(ids)
+
+        counters.add_batch_items(len(ids))
+
+        json_data = b'[' + b', '.join(b'null' if item == None else to_bytes(item) for item in items) + b']'
+
+    elif 'person' in path or 'family' in path:
+        parts = path.split('/')
+        # print('****************************')
+        # print(parts)
 
-        elif 'person' in self.path or 'family' in self.path:
-            parts = self.path.split('/')
-            # print('****************************')
-            # print(parts)
+        if len(parts) < 3:
+            return 404, None
+
+        try:
+            id = decode(int(parts[-1]))
+        except:
+            id = None
+
+        if id == None:
+            return 404, None
+
+        if 'person' in path:
+            json_data = get_person_json(id)
+        else:
+            json_data = get_family_json(id)
+            family_request_order.append(id)
+    else:
+        start_id = 1 # random.randint(1, 100000)
+        data = {"start_family_id" : encode(start_id)}
+        json_data = json.dumps(data)
+
+    if json_data == None:
+        return 404, None
+
+    if not quiet:
+        text = json_data if isinstance(json_data, str) else json_data.decode('utf8')
+        print('Sending:', text)
+        log.write(f'Sending: {text}')
+    return 200, json_data
+
+
+# ----------------------------------------------------------------------------
+class Handler(BaseHTTPRequestHandler):
 
-            if len(parts) < 3:
-                self.send_response(404)
-                self.send_header("Content-type",  "application/json")
-                self.end_headers()
-                with lock:
-                    thread_count -= 1
+    # set to 'HTTP/1.1' by --keep-alive so a socket serves many requests
+    protocol_version = 'HTTP/1.0'
+
+    def setup(self):
+        if self.protocol_version == 'HTTP/1.1':
+            self.timeout = KEEP_ALIVE_TIMEOUT
+        super().setup()
+        self.accepted_at = accepted_times.pop(self.request.fileno(), None)
+
+    def send_reply(self, status, json_data, headers={}):
+        body = to_bytes(json_data)
+        self.send_response(status)
+        self.send_header("Content-type",  "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # the per-request access line on stderr
+        if not quiet:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        started = time.perf_counter()
+        endpoint = endpoint_of(self.path)
+        if endpoint == 'stats':
+            self.send_reply(200, stats_json())
+            return
+
+        # queueing is only measured for the first request on a connection
+        queued = 0.0 if self.accepted_at == None else started - self.accepted_at
+        self.accepted_at = None
+
+        # a rejected request is counted as rejected, not as an API call
+        retry_after = limiter.admit(endpoint)
+        if retry_after != None:
+            status, json_data, headers = busy_reply(retry_after)
+            try:
+                self.send_reply(status, json_data, headers)
+            finally:
+                metrics.record(endpoint, status, queued, time.perf_counter() - started)
+            return
+
+        begin_request(self.path)
+        status = None
+        try:
+            delay = latency_model.sample(endpoint)
+            if delay > 0:
+                time.sleep(delay)
+
+            status, json_data = process_path(self.path)
+            self.send_reply(status, json_data)
+        finally:
+            # also when the client has hung up, or the counts stay too high
+            limiter.release(endpoint)
+            metrics.record(endpoint, status, queued, time.perf_counter() - started)
+            end_request()
+
+# key = socket fileno, value = time the connection was accepted
+accepted_times = {}
+
+class ThreadingSimpleServer(ThreadingMixIn, HTTPServer):
+
+    def process_request(self, request, client_address):
+        accepted_times[request.fileno()] = time.perf_counter()
+        super().process_request(request, client_address)
+
+
+# ----------------------------------------------------------------------------
+# asyncio backend: one event loop holds every connection, the simulated
+# latency is an asyncio.sleep() so waiting requests don't each need a thread.
+# Requests on a keep-alive connection are read and answered in order, which
+# also covers clients that pipeline several requests before reading.
+keep_alive = False
+
+async def handle_connection(reader, writer):
+    try:
+        while True:
+            try:
+                request_line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+            except asyncio.TimeoutError:
                 return
 
+            connection = ''
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'connection':
+                    connection = value.strip().lower()
+            received = time.perf_counter()
+
             try:
-                id = decode(int(parts[-1]))
-            except:
-                id = None
-
-            if id == None:
-                self.send_response(404)
-                self.send_header("Content-type",  "application/json")
-                self.end_headers()
-                with lock:
-                    thread_count -= 1
+                method, path, version = request_line.decode('latin-1').split()
+            except ValueError:
                 return
 
-            if 'person' in self.path:
-                data = self.get_person(id)
+            if version == 'HTTP/1.1':
+                persistent = connection != 'close'
             else:
-                data = self.get_family(id)
-                family_request_order.append(id)
+                persistent = connection == 'keep-alive'
+            persistent = persistent and keep_alive
 
-            if data != None:
-                json_data = json.dumps(data)
+            if method != 'GET':
+                writer.write(build_response(HTTPStatus.NOT_IMPLEMENTED, None, False))
+                await writer.drain()
+                return
+
+            endpoint = endpoint_of(path)
+            if endpoint == 'stats':
+                writer.write(build_response(200, stats_json(), persistent))
+                await writer.drain()
+                if not persistent:
+                    return
+                continue
+
+            # the event loop lag before this request is picked up
+            started = time.perf_counter()
+            queued = started - received
+
+            # a rejected request is counted as rejected, not as an API call
+            retry_after = limiter.admit(endpoint)
+            if retry_after != None:
+                status, json_data, headers = busy_reply(retry_after)
+                try:
+                    writer.write(build_response(status, json_data, persistent, headers))
+                    await writer.drain()
+                finally:
+                    metrics.record(endpoint, status, queued, time.perf_counter() - started)
             else:
-                json_data = None
-        else:
-            start_id = 1 # random.randint(1, 100000)
-            data = {"start_family_id" : encode(start_id)}
-            json_data = json.dumps(data)
-
-        if json_data == None:
-            self.send_response(404)
-            self.send_header("Content-type",  "application/json")
-            self.end_headers()
-        else:
-            print('Sending:', json_data)
-            log.write(f'Sending: {json_data}')
+                begin_request(path)
+                status = None
+                try:
+                    delay = latency_model.sample(endpoint)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+                    status, json_data = process_path(path)
+                    writer.write(build_response(status, json_data, persistent))
+                    await writer.drain()
+                finally:
+                    # also when the client has hung up, or the counts stay too high
+                    limiter.release(endpoint)
+                    metrics.record(endpoint, status, queued, time.perf_counter() - started)
+                    end_request()
+
+            if not persistent:
+                return
 
-            self.send_response(200)
-            self.send_header("Content-type",  "application/json")
-            self.end_headers()
-            self.wfile.write(bytes(json_data, "utf8"))
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
 
-        with lock:
-            thread_count -= 1
 
-class ThreadingSimpleServer(ThreadingMixIn, HTTPServer):
-    pass
+def build_response(status, json_data, persistent, headers={}):
+    status = HTTPStatus(status)
+    body = to_bytes(json_data)
+    version = 'HTTP/1.1' if keep_alive else 'HTTP/1.0'
+    header = f'{version} {status.value} {status.phrase}\r\n' + \
+             f'Date: {formatdate(usegmt=True)}\r\n' + \
+             'Content-type: application/json\r\n' + \
+             f'Content-Length: {len(body)}\r\n' + \
+             f'Connection: {"keep-alive" if persistent else "close"}\r\n' + \
+             ''.join(f'{name}: {value}\r\n' for name, value in headers.items()) + \
+             '\r\n'
+    return header.encode('latin-1') + body
+
+
+async def serve_async():
+    server = await asyncio.start_server(handle_connection, hostName, serverPort, backlog=1024)
+    async with server:
+        await server.serve_forever()
+
 
 if __name__ == '__main__':
     # random.seed(101)
@@ -454,8 +1546,79 @@ if __name__ == '__main__':
     # for id in families:
     #     print(families[id])
 
-    server = ThreadingSimpleServer((hostName, serverPort), Handler)
+    parser = argparse.ArgumentParser(description='Family Search server')
+    parser.add_argument('--backend', choices=('threaded', 'async'), default='threaded',
+                        help='threaded: one thread per connection, async: single asyncio event loop')
+    parser.add_argument('--keep-alive', action='store_true',
+                        help='speak HTTP/1.1 and keep connections open between requests')
+    parser.add_argument('--json-cache', action='store_true',
+                        help='pre-serialize every person and family when the tree is built')
+    parser.add_argument('--compact', action='store_true',
+                        help='build the tree iteratively into compact arrays (for very deep trees)')
+    parser.add_argument('--quiet', action='store_true',
+                        help='no per-request console or log output')
+    parser.add_argument('--async-log', action='store_true',
+                        help='write the log from a background thread in batches')
+    parser.add_argument('--seed', type=int,
+                        help='seed the ids and the tree so every run serves the same tree')
+    parser.add_argument('--snapshot', metavar='PATH',
+                        help='load the tree from PATH if it exists, else save the first tree built there (implies --compact)')
+    parser.add_argument('--latency', default=f'constant:{SLEEP}',
+                        help='latency profile: constant:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA')
+    parser.add_argument('--endpoint-latency', action='append', default=[], metavar='ENDPOINT=PROFILE',
+                        help=f'latency profile for one endpoint ({", ".join(ENDPOINTS)}), can be repeated')
+    parser.add_argument('--spike-rate', type=float, default=0.0,
+                        help='fraction of requests that get --spike extra seconds (tail latency)')
+    parser.add_argument('--spike', type=float, default=2.0,
+                        help='seconds added to a spiked request')
+    parser.add_argument('--max-in-flight', type=int, default=0,
+                        help='reject person / family requests beyond this many at once (0 = no limit)')
+    parser.add_argument('--rate', type=float, default=0.0,
+                        help='token bucket: person / family requests allowed per second (0 = no limit)')
+    parser.add_argument('--burst', type=int, default=10,
+                        help='token bucket size for --rate')
+    parser.add_argument('--reject-status', type=int, choices=(429, 503), default=429,
+                        help='status code of a rejected request')
+    args = parser.parse_args()
+
+    limiter = RequestLimiter(args.max_in_flight, args.rate, args.burst, args.reject_status)
+
+    try:
+        endpoints = dict(spec.split('=', 1) for spec in args.endpoint_latency)
+        latency_model = LatencyModel(args.latency, endpoints, args.spike_rate, args.spike, args.seed)
+    except ValueError as error:
+        parser.error(str(error))
+
+    if args.seed != None:
+        tree_seed = args.seed
+        seeded = random.Random(tree_seed)
+        PRIME = seeded.choice(primes)
+        ID = seeded.randint(10000, 10000000)
+
+    if args.snapshot != None:
+        snapshot_path = args.snapshot
+        if os.path.exists(snapshot_path):
+            gens, PRIME, ID, tree = load_snapshot(snapshot_path)
+            snapshot = (gens, tree)
+            print(f'Loaded snapshot {snapshot_path}: {gens} generations')
+            log.write(f'Loaded snapshot {snapshot_path}: {gens} generations')
+
+    quiet = args.quiet
+    if args.async_log:
+        log.start_writer()
+
+    json_cache_enabled = args.json_cache
+    compact_tree_enabled = args.compact
+
+    if args.keep_alive:
+        keep_alive = True
+        Handler.protocol_version = 'HTTP/1.1'
+
     print('Starting Family Search server, use <Ctrl-C> or <Command-C> to stop')
-    print(f'URL = {hostName}:{serverPort}\n')
-    server.serve_forever()
+    print(f'URL = {hostName}:{serverPort} ({args.backend} backend)\n')
 
+    if args.backend == 'async':
+        asyncio.run(serve_async())
+    else:
+        server = ThreadingSimpleServer((hostName, serverPort), Handler)
+        server.serve_forever()